@@ -0,0 +1,15 @@
+from time import perf_counter
+
+
+def measure(n_repeats: int, function: callable):  # best time of several runs
+    best = None
+
+    for _ in range(n_repeats):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
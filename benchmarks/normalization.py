@@ -0,0 +1,41 @@
+# Throughput of the fused normalization regex against the per-pattern baseline on cell texts of a fetaqa jsonl dataset,
+# run from the root of the repository: python -m benchmarks.normalization
+
+from click import command, argument, option
+
+from fq.util import normalize_spaces, drop_space_around_punctuation, normalize_text, normalize_texts
+from fq.util.serialization import loads
+
+from .measure import measure
+
+
+def normalize_per_pattern(text: str):  # as texts were normalized before the patterns were fused
+    return drop_space_around_punctuation(normalize_spaces(text))
+
+
+@command()
+@argument('path', type = str, default = 'data/fetaQA-v1_dev.jsonl')
+@option('--n-repeats', '-n', type = int, default = 5)
+def main(path: str, n_repeats: int):
+    texts = []
+
+    with open(path, 'rb') as file:
+        for line in file:
+            for row in loads(line)['table_array']:
+                texts.extend(f'  {cell} ,\n' for cell in row)  # add some spaces to normalize
+
+    if (n_mismatches := sum(normalized != expected for normalized, expected in zip(normalize_texts(texts), map(normalize_per_pattern, texts)))) > 0:
+        print(f'Warning: {n_mismatches} texts are normalized differently from the baseline')
+
+    per_pattern = measure(n_repeats, lambda: [normalize_per_pattern(text) for text in texts])
+    fused = measure(n_repeats, lambda: [normalize_text(text) for text in texts])
+    batch = measure(n_repeats, lambda: normalize_texts(texts))
+
+    print(f'{len(texts)} texts, best of {n_repeats} runs')
+    print(f'normalize_spaces + drop_space_around_punctuation: {len(texts) / per_pattern:.0f} texts/s')
+    print(f'normalize_text: {len(texts) / fused:.0f} texts/s ({per_pattern / fused:.2f}x)')
+    print(f'normalize_texts: {len(texts) / batch:.0f} texts/s ({per_pattern / batch:.2f}x)')
+
+
+if __name__ == '__main__':
+    main()
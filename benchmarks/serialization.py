@@ -0,0 +1,39 @@
+# Throughput of the available json backends on a jsonl dataset, run from the root of the repository: python -m benchmarks.serialization
+
+from click import command, argument, option
+from pandas import DataFrame
+
+from fq.util.serialization import BACKENDS
+
+from .measure import measure
+
+
+@command()
+@argument('path', type = str, default = 'data/fetaQA-v1_dev.jsonl')
+@option('--n-repeats', '-n', type = int, default = 5)
+def main(path: str, n_repeats: int):
+    with open(path, 'rb') as file:
+        lines = file.readlines()
+
+    items = [BACKENDS['json'].loads(line) for line in lines]
+    n_bytes = sum(len(line) for line in lines)
+
+    results = {}
+
+    for name, backend in BACKENDS.items():
+        results[name] = {
+            key: f'{n_bytes / 1024 / 1024 / elapsed:.1f} MB/s'
+            for key, elapsed in (
+                ('loads', measure(n_repeats, lambda: [backend.loads(line) for line in lines])),
+                ('dumps (indent = 2)', measure(n_repeats, lambda: [backend.dumps(item, indent = 2) for item in items])),
+                ('dumps (compact)', measure(n_repeats, lambda: [backend.dumps(item, compact = True) for item in items]))
+            )
+        }
+
+    print(f'{len(lines)} items, {n_bytes / 1024 / 1024:.1f} MB, best of {n_repeats} runs')
+    print()
+    print(DataFrame.from_dict(results, orient = 'index'))
+
+
+if __name__ == '__main__':
+    main()
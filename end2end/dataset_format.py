@@ -3,6 +3,11 @@ import sys
 import glob
 import os
 
+try:
+    from orjson import loads  # only decoding is delegated, output must stay byte-compatible with json.dump
+except ImportError:
+    from json import loads
+
 if __name__=="__main__":
     if len(sys.argv)<3:
         print('usage: python dataset_format.py inputdir outputdir')
@@ -12,7 +17,7 @@ if __name__=="__main__":
     infile = sys.argv[1]
     print(infile)
     with open(infile) as f:
-        lines = [json.loads(l) for l in f]
+        lines = [loads(l) for l in f]
     basename = infile.split('/')[-1].split('.')[0]
     split = basename.split('_')[-1]
     version = basename.split('_')[0].split('-')[-1]
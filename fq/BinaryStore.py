@@ -0,0 +1,223 @@
+import os
+import mmap
+from struct import Struct
+from uuid import UUID
+
+from numpy import array, frombuffer, int32, int64
+
+from .util.serialization import dump, dumps, loads
+from .Table import Table, get_total_n_chars
+from .TableGrid import TableGrid
+from .ShardStore import list_tables, read_table, get_fingerprint
+
+
+BINARY_STORE_FILENAME = '.tables.bin'
+BINARY_STORE_MAGIC = b'FQTB'
+BINARY_STORE_VERSION = 2
+
+HEADER = Struct('<4sIQQ')  # magic, version, offset and length of the directory
+BLOCK_HEADER = Struct('<8Q')  # n_chars of the table, n_cells, n_slots, n_grid_rows, ids kind, ids length, heap length, metadata length
+
+ALIGNMENT = 8
+
+INT_IDS = 0  # int64 array
+UUID_IDS = 1  # 16 bytes per id
+JSON_IDS = 2  # json list, for ids of any other kind
+
+
+def pad(data: bytearray):
+    data.extend(bytes(-len(data) % ALIGNMENT))
+
+
+def is_uuid(id_):
+    try:
+        return isinstance(id_, str) and str(UUID(id_)) == id_
+    except ValueError:
+        return False
+
+
+def encode_ids(ids: list):
+    if all(isinstance(id_, int) and not isinstance(id_, bool) and -2 ** 63 <= id_ < 2 ** 63 for id_ in ids):
+        return INT_IDS, array(ids, dtype = int64).tobytes()
+
+    if all(is_uuid(id_) for id_ in ids):
+        return UUID_IDS, b''.join(UUID(id_).bytes for id_ in ids)
+
+    return JSON_IDS, dumps(ids, compact = True).encode('utf-8')
+
+
+def decode_ids(kind: int, data: memoryview):
+    if kind == INT_IDS:
+        return frombuffer(data, dtype = int64).tolist()
+
+    if kind == UUID_IDS:
+        return [str(UUID(bytes = bytes(data[i:i + 16]))) for i in range(0, len(data), 16)]
+
+    return loads(bytes(data))
+
+
+def encode_table(json: dict, label: str, root: str):  # block with the grid arrays, ids, utf-8 text heap and the rest of json as metadata
+    grid = TableGrid.from_json(json['rows'])
+
+    n_chars = get_total_n_chars(json, label, root)
+
+    ids_kind, ids = encode_ids(grid.ids)
+    heap = grid.buffer.encode('utf-8', 'surrogatepass')
+    metadata = dumps({key: value for key, value in json.items() if key != 'rows'}, compact = True).encode('utf-8')
+
+    data = bytearray(
+        BLOCK_HEADER.pack(
+            n_chars, len(grid.n_rows), len(grid.origins), len(grid.row_offsets) - 1, ids_kind, len(ids), len(heap), len(metadata)
+        )
+    )
+
+    for values in (grid.text_offsets, grid.row_offsets, grid.n_rows, grid.n_cols, grid.origins, grid.placeholders):  # widest types first to keep alignment
+        data.extend(values.tobytes())
+
+    pad(data)
+
+    for part in (ids, heap, metadata):
+        data.extend(part)
+
+    pad(data)
+
+    return data
+
+
+class BinaryStore:
+    # All tables of a directory in one file, which is memory-mapped, so that a table is read by its label without parsing the rest of the corpus.
+    # Offsets and spans of every table are fixed-width arrays used by TableGrid as views over the mapping, only cell texts and ids are decoded
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(os.path.join(path, BINARY_STORE_FILENAME), 'rb') as file:
+            self._data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        magic, version, directory_offset, directory_length = HEADER.unpack_from(self._data, 0)
+
+        if magic != BINARY_STORE_MAGIC:
+            raise ValueError(f'{BINARY_STORE_FILENAME} in {path} is not a table store')
+
+        if version != BINARY_STORE_VERSION:
+            raise ValueError(f'Table store version {version} is not supported, expected {BINARY_STORE_VERSION}')
+
+        directory = loads(self._data[directory_offset:directory_offset + directory_length])
+
+        self.index = directory['index']  # label -> offset of the block
+        self.fingerprints = directory['fingerprints']  # label -> fingerprint of the file which kept the table when the store was built
+
+    @staticmethod
+    def exists(path: str):
+        return os.path.isfile(os.path.join(path, BINARY_STORE_FILENAME))
+
+    @classmethod
+    def from_dir(cls, path: str):  # the store of the directory if it is up to date with the tables, otherwise None
+        if not cls.exists(path):
+            return None
+
+        try:
+            store = cls(path)
+        except ValueError:  # written by another version
+            return None
+
+        return store if store.is_fresh else None
+
+    @property
+    def is_fresh(self):  # no table was added, removed or rewritten since the store was built
+        return self.fingerprints == {label: get_fingerprint(self.path, location) for label, location in list_tables(self.path)}
+
+    @classmethod
+    def build(cls, path: str):  # writes tables of a directory with one file per table or a sharded directory to the store next to them
+        store_path = os.path.join(path, BINARY_STORE_FILENAME)
+
+        index, fingerprints = {}, {}
+
+        with open(tmp_store_path := f'{store_path}.tmp', 'wb') as file:
+            file.write(bytes(HEADER.size))
+            offset = HEADER.size
+
+            for label, location in list_tables(path):
+                fingerprints[label] = get_fingerprint(path, location)  # taken before reading, so that a table rewritten meanwhile makes the store stale
+
+                block = encode_table(read_table(path, location), label, path)
+
+                file.write(block)
+
+                index[label] = offset
+                offset += len(block)
+
+            directory = dumps({'index': index, 'fingerprints': fingerprints}, compact = True).encode('utf-8')
+            file.write(directory)
+
+            file.seek(0)
+            file.write(HEADER.pack(BINARY_STORE_MAGIC, BINARY_STORE_VERSION, offset, len(directory)))
+
+        os.replace(tmp_store_path, store_path)
+
+        return cls(path)
+
+    @property
+    def labels(self):
+        return list(self.index)
+
+    def _read(self, label: str):  # n_chars, grid and metadata of the table
+        offset = self.index[label]
+
+        n_chars, n_cells, n_slots, n_grid_rows, ids_kind, ids_length, heap_length, metadata_length = BLOCK_HEADER.unpack_from(self._data, offset)
+        offset += BLOCK_HEADER.size
+
+        def view(dtype, count: int):
+            nonlocal offset
+
+            values = frombuffer(self._data, dtype = dtype, count = count, offset = offset)
+            offset += values.nbytes
+
+            return values
+
+        text_offsets = view(int64, n_cells + 1)
+        row_offsets = view(int64, n_grid_rows + 1)
+        n_rows = view(int32, n_cells)
+        n_cols = view(int32, n_cells)
+        origins = view(int32, n_slots)
+        placeholders = view(bool, n_slots)
+
+        offset += -offset % ALIGNMENT
+
+        data = memoryview(self._data)
+
+        ids = decode_ids(ids_kind, data[offset:(offset := offset + ids_length)])
+        buffer = str(data[offset:(offset := offset + heap_length)], 'utf-8', 'surrogatepass')
+        metadata = loads(bytes(data[offset:offset + metadata_length]))
+
+        data.release()
+
+        return n_chars, TableGrid(buffer, text_offsets, n_rows, n_cols, ids, row_offsets, origins, placeholders), metadata
+
+    def get(self, label: str, make_context: callable = None):
+        n_chars, grid, metadata = self._read(label)
+
+        table = Table.from_json(metadata, make_context, label = label, root = self.path, grid = grid)
+        table._n_chars = n_chars
+
+        return table
+
+    def read(self, label: str):  # json of the table as it was in the directory
+        _, grid, metadata = self._read(label)
+
+        return grid.serialize_rows() | metadata
+
+    def items(self):  # (label, table) pairs in the order in which the tables were written
+        for label in self.index:
+            yield label, self.get(label)
+
+    def tables(self):
+        for label in self.index:
+            yield self.get(label)
+
+    def to_dir(self, destination: str, indent: int = 2):  # one json file per table, sidecar xml files which tables refer to are expected to be copied separately
+        os.makedirs(destination, exist_ok = True)
+
+        for label in self.index:
+            with open(os.path.join(destination, label), 'w', encoding = 'utf-8') as file:
+                dump(self.read(label), file, indent = indent)
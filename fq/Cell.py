@@ -6,6 +6,8 @@ from .TableType import TableType
 
 
 class ReferentiableObject:
+    __slots__ = ('_id', )
+
     def __init__(self, id_ = None):
         self._id = id_
 
@@ -16,9 +18,15 @@ class ReferentiableObject:
 
         return self._id
 
+    @id.setter
+    def id(self, value: str | int):
+        self._id = value
+
 
 class Cell(ReferentiableObject):
-    def __init__(self, text: str, n_rows = 1, n_cols = 1, id_: str = None):
+    __slots__ = ('text', 'n_rows', 'n_cols')
+
+    def __init__(self, text: str, n_rows = 1, n_cols = 1, id_: str | int = None):
         self.text = text
 
         self.n_rows = n_rows
@@ -37,18 +45,10 @@ class Cell(ReferentiableObject):
             cell = Placeholder(id_to_cell[cell_id])
         else:
             cell = cls(text, json.get('rows'), json.get('cols'), cell_id)
-
-        id_to_cell[cell_id] = cell
+            id_to_cell[cell_id] = cell  # placeholders must refer to the origin cell, not to the placeholder from the previous row
 
         return cell
 
-    @property
-    def id(self):
-        if self._id is None:
-            self._id = str(uuid.uuid4())
-
-        return self._id
-
     @classmethod
     def merge_horizontally(cls, row: list[Cell]):
         merged_row = []
@@ -166,6 +166,8 @@ class Cell(ReferentiableObject):
 
 
 class Placeholder:
+    __slots__ = ('origin', )
+
     def __init__(self, origin: Cell):
         self.origin = origin
 
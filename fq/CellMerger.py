@@ -0,0 +1,135 @@
+from numpy import array, int64, zeros, cumsum, flatnonzero, diff, append, arange, repeat, bincount, where, ndarray, fromiter
+
+from .Cell import Cell, Placeholder
+
+
+NONE_CODE = -1
+
+
+def intern_texts(texts: list[str]):  # the same texts get the same integer codes, missing texts get NONE_CODE
+    codes = {None: NONE_CODE}
+
+    return fromiter((codes.setdefault(text, len(codes)) for text in texts), dtype = int64, count = len(texts))
+
+
+def get_row_starts(row_lengths: ndarray):
+    row_starts = zeros(len(row_lengths) + 1, dtype = int64)
+    row_starts[1:] = cumsum(row_lengths)
+
+    return row_starts
+
+
+def get_runs(text_codes: ndarray, row_lengths: ndarray):
+    # Same grouping as in Cell.merge_horizontally: runs of equal texts are merged, a cell without text always starts a new run,
+    # and such a run is kept only if it is the last one in the row
+
+    row_starts = get_row_starts(row_lengths)
+
+    is_run_start = zeros(len(text_codes), dtype = bool)
+
+    if len(text_codes) > 0:
+        is_run_start[0] = True
+        is_run_start[1:] = (text_codes[1:] != text_codes[:-1]) | (text_codes[:-1] == NONE_CODE)
+        is_run_start[row_starts[:-1][row_lengths > 0]] = True
+
+    run_starts = flatnonzero(is_run_start)
+    run_lengths = diff(append(run_starts, len(text_codes)))
+
+    run_rows = repeat(arange(len(row_lengths)), row_lengths)[run_starts]
+    is_kept = (text_codes[run_starts] != NONE_CODE) | append(run_rows[1:] != run_rows[:-1], True)
+
+    return run_starts[is_kept], run_lengths[is_kept], bincount(run_rows[is_kept], minlength = len(row_lengths))
+
+
+def match_vertically(text_codes: ndarray, n_cols: ndarray, row_lengths: ndarray):
+    # Same comparison as in Cell.merge_vertically: a cell is merged into the cell at the same position in the previous row if both have
+    # the same text, width and column offset. Placeholders only replace cells equal to their origin, so all comparisons can be made on the source rows
+
+    row_starts = get_row_starts(row_lengths)
+    n_cells = len(text_codes)
+
+    cell_rows = repeat(arange(len(row_lengths)), row_lengths)
+    positions = arange(n_cells) - row_starts[cell_rows]
+
+    offsets = cumsum(n_cols) - n_cols
+    offsets -= offsets[row_starts[cell_rows]]
+
+    has_cell_above = (cell_rows > 0) & (positions < row_lengths[cell_rows - 1])
+    above = where(has_cell_above, row_starts[cell_rows - 1] + positions, 0)
+
+    matches = has_cell_above & (text_codes[above] == text_codes) & (n_cols[above] == n_cols) & (offsets[above] == offsets)
+
+    origins = arange(n_cells)
+
+    for row in flatnonzero(bincount(cell_rows[matches], minlength = len(row_lengths))).tolist():  # only rows with merged cells depend on the previous one
+        start, end = row_starts[row], row_starts[row + 1]
+        origins[start:end] = where(matches[start:end], origins[above[start:end]], origins[start:end])
+
+    return matches, origins, bincount(origins[matches], minlength = n_cells)
+
+
+def make_rows(cells: list[Cell], matches: ndarray, origins: ndarray, row_lengths: ndarray):  # replace merged cells with placeholders and split into rows
+    placeholders = {}
+
+    for i, origin in zip(flatnonzero(matches).tolist(), origins[matches].tolist()):
+        if (placeholder := placeholders.get(origin)) is None:
+            placeholders[origin] = placeholder = cells[origin].make_placeholder()
+
+        cells[i] = placeholder
+
+    return split(cells, row_lengths)
+
+
+def split(cells: list[Cell], row_lengths: ndarray):
+    rows = []
+    start = 0
+
+    for length in row_lengths.tolist():
+        rows.append(cells[start:start + length])
+        start += length
+
+    return rows
+
+
+def merge_horizontally(rows: list[list[Cell]], cell_class: type = Cell):  # same as Cell.merge_horizontally applied to every row
+    texts = [cell.text for row in rows for cell in row]
+
+    run_starts, run_lengths, row_lengths = get_runs(intern_texts(texts), array([len(row) for row in rows], dtype = int64))
+
+    return split([cell_class(texts[start], 1, length) for start, length in zip(run_starts.tolist(), run_lengths.tolist())], row_lengths)
+
+
+def merge_vertically(rows: list[list[Cell]]):  # same as Cell.merge_vertically, the first row and the cells which are not merged are reused
+    if len(rows) < 2 or any(isinstance(cell, Placeholder) for row in rows for cell in row):
+        return Cell.merge_vertically(rows)
+
+    cells = [cell for row in rows for cell in row]
+    row_lengths = array([len(row) for row in rows], dtype = int64)
+
+    matches, origins, n_merged_rows = match_vertically(
+        intern_texts([cell.text for cell in cells]), array([cell.n_cols for cell in cells], dtype = int64), row_lengths
+    )
+
+    for origin in flatnonzero(n_merged_rows).tolist():
+        cells[origin].n_rows += int(n_merged_rows[origin])
+
+    merged_rows = make_rows(cells, matches, origins, row_lengths)
+    merged_rows[0] = rows[0]
+
+    return merged_rows
+
+
+def merge(rows: list[list[Cell]], cell_class: type = Cell):
+    # Same as merging every row horizontally and then merging the result vertically, but cells which turn into placeholders are never created
+
+    text_codes = intern_texts(texts := [cell.text for row in rows for cell in row])
+
+    run_starts, run_lengths, row_lengths = get_runs(text_codes, array([len(row) for row in rows], dtype = int64))
+    matches, origins, n_merged_rows = match_vertically(text_codes[run_starts], run_lengths, row_lengths)
+
+    cells = [
+        None if is_merged else cell_class(texts[start], 1 + n_rows, length)
+        for start, length, n_rows, is_merged in zip(run_starts.tolist(), run_lengths.tolist(), n_merged_rows.tolist(), matches.tolist())
+    ]
+
+    return make_rows(cells, matches, origins, row_lengths)
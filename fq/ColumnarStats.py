@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from numpy import array, arange, repeat, concatenate, bincount, diff, int64, float64, errstate, where, zeros
+from pandas import DataFrame
+
+from .util import are_numbers
+from .Table import Table, TableStats
+from .TableGrid import TableGrid
+
+
+class ColumnarStats:
+    # Cells of all tables flattened into parallel arrays, from which the features of TableStats.as_vector are computed for every table at once.
+    # Only origin cells are kept, so spans and lengths are counted once per cell as in TableStats
+
+    def __init__(self, labels: list[str], n_rows, n_cols, tables, lengths, numeric, rowspans, colspans):
+        self.labels = labels
+
+        self.n_rows = n_rows  # number of rows in every table
+        self.n_cols = n_cols  # number of slots in the longest row of every table
+
+        self.tables = tables  # index of the table for every cell
+        self.lengths = lengths
+        self.numeric = numeric
+        self.rowspans = rowspans
+        self.colspans = colspans
+
+    @classmethod
+    def from_tables(cls, tables: Iterable[Table]):  # tables are consumed one by one and are not kept, grid-backed ones without materializing rows
+        labels, n_rows, n_cols = [], [], []
+        lengths, numeric, rowspans, colspans = [], [], [], []
+
+        for table in tables:
+            grid = table._grid if table._grid is not None else TableGrid.from_rows(table.rows)
+
+            labels.append(table.label)
+
+            n_rows.append(len(grid.row_offsets) - 1)
+            n_cols.append(0 if len(grid.row_offsets) < 2 else diff(grid.row_offsets).max().item())
+
+            lengths.append(diff(grid.text_offsets))
+            numeric.append(are_numbers(grid.buffer, grid.text_offsets))
+            rowspans.append(grid.n_rows)
+            colspans.append(grid.n_cols)
+
+        def join(arrays: list, dtype: type):
+            return concatenate(arrays).astype(dtype) if len(arrays) > 0 else zeros(0, dtype = dtype)
+
+        return cls(
+            labels, array(n_rows, dtype = int64), array(n_cols, dtype = int64),
+            repeat(arange(len(lengths)), [len(table_lengths) for table_lengths in lengths]),
+            join(lengths, int64), join(numeric, bool), join(rowspans, int64), join(colspans, int64)
+        )
+
+    @property
+    def n_tables(self):
+        return len(self.labels)
+
+    def _count(self, mask = None):
+        return bincount(self.tables if mask is None else self.tables[mask], minlength = self.n_tables)
+
+    def _sum(self, values, mask = None):
+        return bincount(
+            self.tables if mask is None else self.tables[mask], weights = values if mask is None else values[mask], minlength = self.n_tables
+        ).astype(int64)
+
+    @staticmethod
+    def _mean(sums, counts):  # zero for tables without cells, as in TableStats
+        with errstate(divide = 'ignore', invalid = 'ignore'):
+            return where(counts > 0, sums / counts, 0).astype(float64)
+
+    @property
+    def n_cells(self):
+        return self._count()
+
+    @property
+    def non_trivial(self):  # mask of tables which Tables.non_trivial would keep
+        return (self.n_cells > 1) & (self.n_rows > 1) & (self.n_cols > 1)
+
+    @property
+    def as_df(self):  # one row per table with the same columns and values as TableStats.as_vector
+        text = ~self.numeric & (self.lengths > 0)
+        empty = ~self.numeric & (self.lengths < 1)
+
+        n_cells = self._count()
+        n_numeric_cells = self._count(self.numeric)
+        n_text_cells = self._count(text)
+
+        n_chars = self._sum(self.lengths)
+        n_chars_numeric = self._sum(self.lengths, self.numeric)
+        n_chars_text = self._sum(self.lengths, text)
+
+        columns = (
+            n_cells,
+            self.n_rows,
+            self.n_cols,
+            n_chars, self._mean(n_chars, n_cells),
+            n_numeric_cells,
+            n_text_cells,
+            self._count(empty),
+            n_chars_numeric, self._mean(n_chars_numeric, n_numeric_cells),
+            n_chars_text, self._mean(n_chars_text, n_text_cells),
+            self._mean(self._sum(self.rowspans), n_cells),
+            self._mean(self._sum(self.colspans), n_cells)
+        )
+
+        return DataFrame(dict(zip(TableStats.vector_legend, columns)))
+
+    def normalize(self, mask = None):  # z-scores of the features, as TablesStats.as_df computes them
+        df = self.as_df
+
+        if mask is not None:
+            df = df[mask].reset_index(drop = True)
+
+        return (df - df.mean()) / df.std()
@@ -0,0 +1,159 @@
+import os
+from zlib import crc32
+
+from numpy import array, uint32, uint64, random as np_random
+
+from .util import tokenize
+from .util.serialization import dump, load
+from .Cell import Placeholder
+from .Table import Table
+from .Tables import DEFAULT_PREFETCH, load_tables
+from .ShardStore import list_tables
+
+
+DUPLICATES_FILENAME = '.duplicates.json'
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_N_PERMUTATIONS = 128
+DEFAULT_SHINGLE_SIZE = 3
+DEFAULT_SEED = 17
+
+MIN_RECALL = 0.95  # probability with which lsh reports a pair of tables, which have exactly the threshold similarity, as a candidate
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+CELL_BOUNDARY = '|'
+
+
+def get_shingles(table: Table, size: int = DEFAULT_SHINGLE_SIZE):
+    # n-grams of tokens of all cell texts, which are read row by row with cell boundaries kept as tokens,
+    # plus the shape of every row - spans of its cells, so that tables with the same words in a different layout are told apart
+
+    tokens = []
+
+    for text in table.as_texts:
+        if text is not None:
+            tokens.extend(tokenize(text))
+            tokens.append(CELL_BOUNDARY)
+
+    shingles = {' '.join(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))} if len(tokens) > 0 else set()
+
+    shapes = {}
+
+    for row in table.rows:
+        shape = ' '.join('p' if isinstance(cell, Placeholder) else f'{cell.n_rows}x{cell.n_cols}' for cell in row)
+        shapes[shape] = count = shapes.get(shape, 0) + 1
+
+        shingles.add(f'row {shape} #{count}')  # repeated rows are numbered, so that their number affects the similarity
+
+    return shingles
+
+
+def get_bands(n_permutations: int, threshold: float):  # the most selective (n bands, band size) which still has the required recall at the threshold
+    for band_size in range(n_permutations, 0, -1):
+        n_bands = n_permutations // band_size
+
+        if 1 - (1 - threshold ** band_size) ** n_bands >= MIN_RECALL:
+            return n_bands, band_size
+
+    return n_permutations, 1
+
+
+def read_duplicates(path: str):  # label of a duplicate -> label of its canonical table, as saved by fq dedup for the directory
+    if not os.path.isfile(duplicates_path := os.path.join(path, DUPLICATES_FILENAME)):
+        return {}
+
+    with open(duplicates_path, 'rb') as file:
+        return load(file)
+
+
+class Deduplicator:
+    # Tables are compared by minhash signatures of their shingles, and lsh banding yields candidate pairs without comparing every table with every other.
+    # Each table is checked against canonical tables seen before it and either becomes a duplicate of the most similar one or a new canonical table,
+    # so only signatures of canonical tables are kept, and every duplicate is similar to its representative itself, not through a chain of other tables
+
+    def __init__(
+        self, threshold: float = DEFAULT_THRESHOLD, n_permutations: int = DEFAULT_N_PERMUTATIONS, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = DEFAULT_SEED
+    ):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        generator = np_random.default_rng(seed)
+
+        self._a = generator.integers(1, MERSENNE_PRIME, n_permutations, dtype = uint64)[:, None]
+        self._b = generator.integers(0, MERSENNE_PRIME, n_permutations, dtype = uint64)[:, None]
+
+        self.n_bands, self.band_size = get_bands(n_permutations, threshold)
+
+        self._buckets = [{} for _ in range(self.n_bands)]  # band -> band values -> indices of canonical tables
+        self._signatures = []  # of canonical tables
+        self._labels = []  # of canonical tables
+
+        self.n_tables = 0
+        self.duplicates = {}  # label of a duplicate -> label of its canonical table
+
+    @classmethod
+    def from_dir(cls, path: str, workers: int = 1, prefetch: int = DEFAULT_PREFETCH, **kwargs):  # tables are visited in the order of labels
+        deduplicator = cls(**kwargs)
+
+        for table in load_tables(path, sorted(list_tables(path)), grid = True, workers = workers, prefetch = prefetch):
+            deduplicator.add(table)
+
+        return deduplicator
+
+    def get_signature(self, shingles: set[str]):
+        hashes = array([crc32(shingle.encode('utf-8')) for shingle in shingles], dtype = uint64)
+
+        return ((self._a * hashes + self._b) % MERSENNE_PRIME & MAX_HASH).min(axis = 1).astype(uint32)  # products wrap around as in the usual 64-bit implementation
+
+    def _get_bands(self, signature):
+        return [signature[i * self.band_size:(i + 1) * self.band_size].tobytes() for i in range(self.n_bands)]
+
+    def add(self, table: Table):  # returns label of the canonical table if the table is a near duplicate
+        self.n_tables += 1
+
+        if len(shingles := get_shingles(table, self.shingle_size)) < 1:  # tables without content are not deduplicated
+            return None
+
+        signature = self.get_signature(shingles)
+        bands = self._get_bands(signature)
+
+        candidates = {index for buckets, band in zip(self._buckets, bands) for index in buckets.get(band, ())}
+
+        best_index, best_similarity = None, None
+
+        for index in sorted(candidates):  # similarity is estimated as the share of equal minhashes
+            if (similarity := (self._signatures[index] == signature).mean()) >= self.threshold and (best_index is None or similarity > best_similarity):
+                best_index, best_similarity = index, similarity
+
+        if best_index is not None:
+            self.duplicates[table.label] = canonical = self._labels[best_index]
+            return canonical
+
+        index = len(self._signatures)
+
+        self._signatures.append(signature)
+        self._labels.append(table.label)
+
+        for buckets, band in zip(self._buckets, bands):
+            buckets.setdefault(band, []).append(index)
+
+        return None
+
+    @property
+    def clusters(self):  # canonical label -> labels of its duplicates, only for canonical tables which have any
+        clusters = {}
+
+        for label, canonical in self.duplicates.items():
+            clusters.setdefault(canonical, []).append(label)
+
+        return clusters
+
+    def save(self, path: str):
+        duplicates_path = os.path.join(path, DUPLICATES_FILENAME)
+
+        with open(tmp_duplicates_path := f'{duplicates_path}.tmp', 'w', encoding = 'utf-8') as file:
+            dump(self.duplicates, file, indent = 2)
+
+        os.replace(tmp_duplicates_path, duplicates_path)
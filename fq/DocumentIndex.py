@@ -0,0 +1,70 @@
+from bs4 import BeautifulSoup
+
+from .util import normalize_texts, is_bold, is_h1
+
+
+class Paragraph:
+    def __init__(self, soup: BeautifulSoup, position: int, normalized_text: str):
+        self.soup = soup
+        self.position = position
+
+        self.text = soup.text
+        self.normalized_text = '' if normalized_text is None else normalized_text
+
+        self.bold = is_bold(self)
+        self.h1 = is_h1(self)
+
+    def __repr__(self):
+        return f'{self.position}: {self.normalized_text}'
+
+
+class DocumentIndex:  # body-level paragraphs of a document in their original order along with the positions of tables between them
+    def __init__(self, soup: BeautifulSoup):
+        self.soup = soup
+
+        self._paragraphs = None
+        self._table_offsets = None
+
+    def _build(self):
+        paragraph_soups = []
+        table_offsets = {}
+
+        if (body := self.soup.find('w:body')) is not None:
+            for block in body.find_all(('w:p', 'w:tbl'), recursive = False):
+                if block.name == 'w:p':
+                    paragraph_soups.append(block)
+                else:
+                    table_offsets[id(block)] = len(paragraph_soups)  # number of paragraphs which precede the table
+
+        paragraphs = [
+            Paragraph(soup, position, normalized_text)
+            for position, (soup, normalized_text) in enumerate(
+                zip(paragraph_soups, normalize_texts([soup.text for soup in paragraph_soups]))
+            )
+        ]
+
+        self._paragraphs = paragraphs
+        self._table_offsets = table_offsets
+
+    @property
+    def paragraphs(self):
+        if self._paragraphs is None:
+            self._build()
+
+        return self._paragraphs
+
+    def get_table_offset(self, table: BeautifulSoup):
+        if self._table_offsets is None:
+            self._build()
+
+        return self._table_offsets.get(id(table))
+
+    # Paragraphs are iterated in the same order as from findPreviousSiblings and findNextSiblings - starting from the nearest one,
+    # without copying the list, so that a lookup costs as many steps as the caller takes
+
+    def previous_paragraphs(self, offset: int):
+        return map(self.paragraphs.__getitem__, range(offset - 1, -1, -1))
+
+    def next_paragraphs(self, offset: int):
+        return map(self.paragraphs.__getitem__, range(offset, len(self.paragraphs)))
+
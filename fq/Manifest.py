@@ -0,0 +1,89 @@
+import os
+import json
+from hashlib import sha256
+
+
+MANIFEST_FILENAME = '.manifest.json'
+CHUNK_SIZE = 1 << 20
+
+
+def get_hash(path: str):
+    hash_ = sha256()
+
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            hash_.update(chunk)
+
+    return hash_.hexdigest()
+
+
+def get_data_hash(data: bytes):
+    return sha256(data).hexdigest()
+
+
+def get_outputs(entry: dict):
+    return entry['tables'] + entry.get('sidecars', [])
+
+
+class Manifest:  # maps every source file to its content hash, version of the parser and the files produced from it
+    def __init__(self, path: str, entries: dict = None):
+        self.path = path
+        self.entries = {} if entries is None else entries
+
+    @classmethod
+    def from_dir(cls, path: str):
+        if os.path.isfile(manifest_path := os.path.join(path, MANIFEST_FILENAME)):
+            with open(manifest_path, 'r', encoding = 'utf-8') as file:
+                return cls(path, json.load(file))
+
+        return cls(path)
+
+    def get(self, source_file: str):
+        return self.entries.get(source_file)
+
+    def _drop_outputs(self, outputs: list[str]):
+        for output in outputs:
+            if os.path.isfile(output_path := os.path.join(self.path, output)):
+                os.remove(output_path)
+
+    def update(self, source_file: str, entry: dict):
+        if (previous_entry := self.entries.get(source_file)) is not None:
+            self._drop_outputs(set(get_outputs(previous_entry)) - set(get_outputs(entry)))
+
+        self.entries[source_file] = entry
+
+    def forget(self, source_file: str, entry: dict):
+        # The source file will be parsed again on the next run. Until a successful run replaces the entry, it keeps outputs of the previous run
+        # along with the ones written by the failed run, so that none of them is orphaned
+
+        previous_entry = self.entries.get(source_file, {})
+
+        self.entries[source_file] = {
+            'tables': list(dict.fromkeys(previous_entry.get('tables', []) + entry['tables'])),
+            'sidecars': list(dict.fromkeys(previous_entry.get('sidecars', []) + entry.get('sidecars', [])))
+        }
+
+    def remove(self, source_file: str):
+        if (entry := self.entries.pop(source_file, None)) is not None:
+            self._drop_outputs(get_outputs(entry))
+
+    def clear(self):
+        for source_file in list(self.entries):
+            self.remove(source_file)
+
+    def remove_missing(self, source_files: list[str]):
+        source_files = set(source_files)
+        missing_source_files = [source_file for source_file in self.entries if source_file not in source_files]
+
+        for source_file in missing_source_files:
+            self.remove(source_file)
+
+        return missing_source_files
+
+    def save(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILENAME)
+
+        with open(tmp_manifest_path := f'{manifest_path}.tmp', 'w', encoding = 'utf-8') as file:
+            json.dump(self.entries, file, indent = 2, ensure_ascii = False)
+
+        os.replace(tmp_manifest_path, manifest_path)
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+from functools import partial
+
+from .util.serialization import dumps
+from .Table import Table, TableStats
+from .Tables import Tables, TablesStats, DEFAULT_PREFETCH, load_tables
+from .Manifest import Manifest
+from .ShardStore import list_tables, get_fingerprint, is_sharded
+
+
+METADATA_INDEX_FILENAME = '.index.sqlite'
+
+COLUMNS = (
+    'label', 'fingerprint', 'source', 'id', 'type', 'title', *TableStats.counts, 'n_chars', 'non_trivial', 'file', 'offset', 'length'
+)
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS tables (
+    label TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    source TEXT,
+    id TEXT,
+    type TEXT,
+    title TEXT,
+    {', '.join(f'{name} INTEGER NOT NULL' for name in TableStats.counts)},
+    n_chars INTEGER NOT NULL,
+    non_trivial INTEGER NOT NULL,
+    file TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tables_source ON tables (source);
+CREATE INDEX IF NOT EXISTS tables_id ON tables (id);
+CREATE INDEX IF NOT EXISTS tables_type ON tables (type);
+CREATE INDEX IF NOT EXISTS tables_n_rows ON tables (n_rows);
+CREATE INDEX IF NOT EXISTS tables_n_cols ON tables (n_cols);
+CREATE INDEX IF NOT EXISTS tables_n_cells ON tables (n_cells);
+CREATE INDEX IF NOT EXISTS tables_non_trivial ON tables (non_trivial);
+'''
+
+RANGES = {  # query argument -> (column, comparison)
+    'min_rows': ('n_rows', '>='),
+    'max_rows': ('n_rows', '<='),
+    'min_cols': ('n_cols', '>='),
+    'max_cols': ('n_cols', '<='),
+    'min_cells': ('n_cells', '>='),
+    'max_cells': ('n_cells', '<=')
+}
+
+
+def casefold(text: str):  # sqlite folds case of ascii letters only
+    return None if text is None else text.casefold()
+
+
+def authorize_read(action: int, arg1: str, arg2: str, database: str, trigger: str):  # lets a statement only read the tables table and call functions
+    if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION) or (action == sqlite3.SQLITE_READ and arg1 == 'tables'):
+        return sqlite3.SQLITE_OK
+
+    return sqlite3.SQLITE_DENY
+
+
+def get_storage_span(path: str, location: str | tuple[str, int, int]):  # (file, offset, length) of the bytes which keep the table
+    if isinstance(location, str):
+        return location, 0, os.path.getsize(os.path.join(path, location))
+
+    return location
+
+
+class MetadataIndex:  # sqlite database with metadata and stats of every table in a directory, which is kept next to the tables
+    def __init__(self, path: str):
+        self.path = path
+        self.sharded = is_sharded(path)
+
+        self._connection = sqlite3.connect(os.path.join(path, METADATA_INDEX_FILENAME))
+        self._connection.executescript(SCHEMA)
+        self._connection.create_function('casefold', 1, casefold, deterministic = True)
+
+    @staticmethod
+    def exists(path: str):
+        return os.path.isfile(os.path.join(path, METADATA_INDEX_FILENAME))
+
+    def _make_row(self, table: Table, fingerprint: str, source: str, location: str | tuple[str, int, int]):
+        stats = table.stats
+
+        return (
+            table.label, fingerprint, source, None if table.id is None else str(table.id), None if table.type is None else table.type.value, table.title,
+            *(getattr(stats, name) for name in TableStats.counts), table.n_chars, int(stats.is_non_trivial), *get_storage_span(self.path, location)
+        )
+
+    def update(self, workers: int = 1, prefetch: int = DEFAULT_PREFETCH):  # returns the number of tables which were loaded
+        locations = dict(list_tables(self.path))
+        fingerprints = {label: dumps(get_fingerprint(self.path, location)) for label, location in locations.items()}
+
+        sources = {table: source_file for source_file, entry in Manifest.from_dir(self.path).entries.items() for table in entry['tables']}
+
+        indexed = dict(self._connection.execute('SELECT label, fingerprint FROM tables'))
+
+        stale_locations = [(label, location) for label, location in locations.items() if indexed.get(label) != fingerprints[label]]
+
+        with self._connection:
+            self._connection.executemany('DELETE FROM tables WHERE label = ?', [(label, ) for label in indexed if label not in locations])
+
+            self._connection.executemany(
+                f'INSERT OR REPLACE INTO tables ({", ".join(COLUMNS)}) VALUES ({", ".join("?" for _ in COLUMNS)})',
+                (
+                    self._make_row(table, fingerprints[table.label], sources.get(table.label), locations[table.label])
+                    for table in load_tables(self.path, stale_locations, grid = True, workers = workers, prefetch = prefetch)
+                )
+            )
+
+        return len(stale_locations)
+
+    def _get_conditions(
+        self, type_: str = None, source: str = None, id_: str = None, title: str = None, non_trivial: bool = False, where: str = None, **ranges: int
+    ):
+        # sql condition and its parameters, the title is matched as a case-insensitive substring, and where is an arbitrary sql condition,
+        # which is inserted as is - queries are run by _read, so it can only read the index
+
+        conditions, parameters = [], []
+
+        for column, value in (('type', type_), ('source', source), ('id', id_)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                parameters.append(value)
+
+        if title is not None:
+            conditions.append("casefold(title) LIKE ? ESCAPE '\\'")
+            parameters.append('%' + casefold(title).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+
+        if non_trivial:
+            conditions.append('non_trivial = 1')
+
+        for name, value in ranges.items():
+            if value is not None:
+                column, comparison = RANGES[name]
+
+                conditions.append(f'{column} {comparison} ?')
+                parameters.append(value)
+
+        if where is not None:
+            conditions.append(f'({where})')
+
+        return '' if len(conditions) < 1 else ' WHERE ' + ' AND '.join(conditions), parameters
+
+    def _read(self, query: str, parameters: list):  # rows of a query which is denied anything but reading the index
+        self._connection.set_authorizer(authorize_read)
+
+        try:
+            return self._connection.execute(query, parameters).fetchall()
+        finally:
+            self._connection.set_authorizer(None)
+
+    def select(
+        self, type_: str = None, source: str = None, id_: str = None, title: str = None, non_trivial: bool = False, where: str = None, **ranges: int
+    ):
+        # (label, location) of matching tables
+
+        condition, parameters = self._get_conditions(type_, source, id_, title, non_trivial, where, **ranges)
+
+        return [
+            (label, (file, offset, length) if self.sharded else file)
+            for label, file, offset, length in self._read(f'SELECT label, file, offset, length FROM tables{condition} ORDER BY label', parameters)
+        ]
+
+    def get_totals(self, **predicates):  # number and total serialized size of tables matching the predicates
+        condition, parameters = self._get_conditions(**predicates)
+
+        (n_tables, total_length), = self._read(f'SELECT COUNT(*), SUM(n_chars) FROM tables{condition}', parameters)
+
+        return n_tables, 0 if total_length is None else total_length
+
+    def load(self, grid: bool = False, workers: int = 1, prefetch: int = DEFAULT_PREFETCH, **predicates):
+        # tables matching the predicates of select, which are evaluated by the index, so that e.g. only non-trivial tables are read from disk
+
+        return IndexedTables(self, grid, workers, prefetch, predicates)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class IndexedTables(Tables):
+    # Tables selected by an index, the non-trivial subset of which is selected by the index as well, so that trivial tables are never loaded.
+    # Stats of the subset are compared with totals of the index instead of stats of the whole collection. The index must stay open until non_trivial is taken
+
+    def __init__(self, index: MetadataIndex, grid: bool, workers: int, prefetch: int, predicates: dict, base: Tables = None):
+        super().__init__(partial(load_tables, index.path, index.select(**predicates), grid, workers, prefetch), base = base)
+
+        self._index = index
+        self._loading = (grid, workers, prefetch)
+        self._predicates = predicates
+
+    @property
+    def stats(self):
+        if self._stats is None and self._base is not None:
+            base_stats = TablesStats()  # only the totals, which the subset is compared with
+            base_stats.n_tables, base_stats.total_length = self._index.get_totals(**self._base._predicates)
+
+            self._stats = TablesStats(self, base_stats)
+
+        return super().stats
+
+    @property
+    def non_trivial(self):
+        if self._predicates.get('non_trivial'):
+            return self
+
+        return IndexedTables(self._index, *self._loading, self._predicates | {'non_trivial': True}, base = self)
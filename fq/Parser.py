@@ -1,16 +1,27 @@
 import os
 import re
+from io import BytesIO
+from time import time
 from pathlib import Path
+from itertools import islice
 from enum import Enum
+from typing import BinaryIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from tqdm import tqdm
 from docx.api import Document
 from bs4 import BeautifulSoup
 
-from .util import normalize_spaces, is_bold, has_not_fewer_dots_than, drop_space_around_punctuation, is_h1, is_space
+from .util import normalize_spaces, normalize_text, normalize_texts, is_bold, has_not_fewer_dots_than, is_h1, is_space, iterparse_tables, Automaton, is_archive, list_members, read_member, close_archives
 from .util.soup import get_first_non_empty_element
+from .util.serialization import dumps
 from .Table import Table
 from .TableType import TableType
+from .Manifest import Manifest, get_hash, get_data_hash
+from .DocumentIndex import DocumentIndex, Paragraph
+from .XmlStore import XmlStore
+from .ShardStore import ShardStore, DEFAULT_MAX_SHARD_SIZE, is_sharded, remove_shards
+from .SearchIndex import SearchIndex, SEARCH_INDEX_FILENAME
 
 
 PARAGRAPH_SEP_PLACEHOLDER = '__PARAGRAPH_SEP__'
@@ -22,6 +33,8 @@ APPLICATION_TABLE_ID = re.compile('([A-ZА-ЯЁ]+).+')
 NOT_APPLICATION_TABLE_ID = re.compile(r'\w+')
 EXTERNAL_APPLICATION_REFERENCE_PATTERN = re.compile(r'.+сп\s+[0-9.]+\.?$')
 
+PARSER_VERSION = 1  # increment when the output format changes to invalidate tables produced by previous versions
+
 
 def join_paragraphs(paragraphs: list):
     if len(paragraphs) < 1:
@@ -45,11 +58,12 @@ def extract_id(id_, pattern, text: str):
     return id_
 
 
-def is_not_part_of_other_id(text, id_, verbose = False):
+def is_not_part_of_other_id(text, id_, verbose = False, loc = None):
     if verbose:
         print('checking for table id singularity')
 
-    loc = text.find(id_)
+    if loc is None:
+        loc = text.find(id_)
 
     if loc > 0:
         prev_loc = loc - 1
@@ -120,10 +134,136 @@ def is_not_part_of_other_id(text, id_, verbose = False):
         )
 
 
+class ReferenceResolver:  # makes the same decisions as Parser.has_reference for all (paragraph, table) pairs, but scans each paragraph once
+    def __init__(self, tables: list[Table]):
+        self.tables = tables
+
+        application_patterns = {}
+        table_specs = []
+
+        for table in tables:
+            if (id_ := table.id) is None:
+                table_specs.append(None)
+                continue
+
+            if NOT_APPLICATION_TABLE_ID.fullmatch(id_):
+                application_id = None
+            elif (application_table_id_match := APPLICATION_TABLE_ID.fullmatch(id_)) is None:
+                application_id = None
+            else:
+                application_id = application_table_id_match.group(1)
+
+                if application_id not in application_patterns:
+                    application_patterns[application_id] = re.compile(r'\s' + application_id + r'[^\w\s\.]')
+
+            table_specs.append((id_, TableType(table.type), application_id))
+
+        self.table_specs = table_specs
+        self.application_patterns = application_patterns
+        self.automaton = Automaton([spec[0] for spec in table_specs if spec is not None])
+
+    def resolve(self, texts: list[str]):  # for each table returns indices of the texts which refer to it
+        references = [[] for _ in self.tables]
+
+        for i, text in enumerate(texts):
+            normalized_text = text.lower().strip()
+
+            if normalized_text.startswith('табл'):
+                continue
+
+            has_table_stem = 'табл' in normalized_text
+            has_form_stem = ' форм' in normalized_text
+            looks_like_application_reference = (
+                ('приложен' in normalized_text or has_table_stem) and
+                EXTERNAL_APPLICATION_REFERENCE_PATTERN.fullmatch(normalized_text) is None
+            )
+
+            if not (has_table_stem or has_form_stem or looks_like_application_reference):
+                continue
+
+            positions = self.automaton.find_first(text)
+            application_matches = {}
+
+            for j, spec in enumerate(self.table_specs):
+                if spec is None:
+                    continue
+
+                id_, table_type, application_id = spec
+
+                if not (
+                    table_type == TableType.TABLE and has_table_stem or
+                    table_type == TableType.FORM and has_form_stem or
+                    (table_type == TableType.APPLICATION or application_id is not None) and looks_like_application_reference
+                ):
+                    continue
+
+                if (
+                    (loc := positions.get(id_)) is not None and is_not_part_of_other_id(text, id_, loc = loc) or
+                    table_type == TableType.FORM
+                ):
+                    references[j].append(i)
+                    continue
+
+                if application_id is not None:
+                    if (application_match := application_matches.get(application_id)) is None:
+                        application_matches[application_id] = application_match = (
+                            self.application_patterns[application_id].search(text) is not None and
+                            not text.endswith(application_id)
+                        )
+
+                    if application_match:
+                        references[j].append(i)
+
+        return references
+
+
+# Neighbours are looked up in the document index when it is available, otherwise each lookup walks the siblings of the paragraph
+
+def get_previous_paragraphs(paragraphs: list, j: int, index: DocumentIndex = None):
+    paragraph = paragraphs[j]
+
+    if index is not None and isinstance(paragraph, Paragraph):
+        return index.previous_paragraphs(paragraph.position)
+
+    try:
+        return paragraph.findPreviousSiblings('w:p')
+    except AttributeError:
+        return paragraphs[:j]
+
+
+def get_next_paragraphs(paragraphs: list, j: int, index: DocumentIndex = None):
+    paragraph = paragraphs[j]
+
+    if index is not None and isinstance(paragraph, Paragraph):
+        return index.next_paragraphs(paragraph.position + 1)
+
+    try:
+        return paragraph.findNextSiblings('w:p')
+    except AttributeError:
+        return paragraphs[j + 1:]
+
+
 class Parser:
-    def __init__(self, context_window_size: int = 5, json_indent: int = 2):
+    def __init__(
+        self, context_window_size: int = 5, json_indent: int = 2, streaming: bool = False, xml_sidecar: bool = False,
+        sharded: bool = False, max_shard_size: int = DEFAULT_MAX_SHARD_SIZE, compress: bool = False, compact_ids: bool = False,
+        search_index: bool = False
+    ):
         self.context_window_size = context_window_size
         self.json_indent = json_indent
+        self.streaming = streaming
+        self.xml_sidecar = xml_sidecar
+
+        self.sharded = sharded
+        self.max_shard_size = max_shard_size
+        self.compress = compress
+
+        self.compact_ids = compact_ids
+        self.search_index = search_index  # the index is updated after every run once it exists
+
+    @property
+    def output_options(self):  # options which change what is written for a document, which is parsed again when they differ from the ones in its manifest entry
+        return {'xml_sidecar': self.xml_sidecar, 'sharded': self.sharded, 'compress': self.compress, 'compact_ids': self.compact_ids}
 
     def has_reference(self, text: str, table: Table, verbose: bool = False):
         id_ = table.id
@@ -208,7 +348,10 @@ class Parser:
         #     )
         # )
 
-    def get_title(self, paragraphs, verbose: bool = False, title: str = None):
+    def get_references(self, texts: list[str], tables: list[Table]):
+        return ReferenceResolver(tables).resolve(texts)
+
+    def get_title(self, paragraphs, verbose: bool = False, title: str = None, index: DocumentIndex = None):
         # window = self.context_window_size
         # section_title = title
 
@@ -219,22 +362,17 @@ class Parser:
         table_type = None
         # full_reference_exists = False
 
-        for j, paragraph in enumerate(paragraphs):
-            text = '' if paragraph.text is None else drop_space_around_punctuation(normalize_spaces(paragraph.text))  # TODO: Add better handler for None values
+        texts = normalize_texts([None if isinstance(paragraph, Paragraph) else paragraph.text for paragraph in paragraphs])
+
+        for j, (paragraph, text) in enumerate(zip(paragraphs, texts)):
+            if isinstance(paragraph, Paragraph):
+                text = paragraph.normalized_text
+            elif text is None:  # TODO: Add better handler for None values
+                text = ''
 
             if len(text) > 0:
                 non_empty_paragraphs.append(text)
 
-            try:
-                previous_paragraphs = paragraph.findPreviousSiblings('w:p')
-            except AttributeError:
-                previous_paragraphs = paragraphs[:j]
-
-            try:
-                next_paragraphs = paragraph.findNextSiblings('w:p')
-            except AttributeError:
-                next_paragraphs = paragraphs[j + 1:]
-
             if len(text.strip()) > 0:
                 normalized_text = text.lower().strip()
 
@@ -261,7 +399,7 @@ class Parser:
                     application_table_id_match = APPLICATION_TABLE_ID.fullmatch(id_)
 
                     if application_table_id_match is not None and text.endswith(id_):
-                        last_paragraph = get_first_non_empty_element(previous_paragraphs)
+                        last_paragraph = get_first_non_empty_element(get_previous_paragraphs(paragraphs, j, index))
                         table_type = TableType.APPLICATION
 
                         if last_paragraph is not None and (
@@ -271,13 +409,13 @@ class Parser:
                                 not is_bold(paragraph) and not (is_bold(last_paragraph) or is_h1(last_paragraph))
                             )
                         ):
-                            title.append(drop_space_around_punctuation(normalize_spaces(last_paragraph.text)))
+                            title.append(normalize_text(last_paragraph.text))
                     else:
                         table_type = TableType.TABLE
                 elif id_ is None and normalized_text.startswith('форма'):
                     title.append(text)
 
-                    next_non_empty_paragraph = get_first_non_empty_element(next_paragraphs)
+                    next_non_empty_paragraph = get_first_non_empty_element(get_next_paragraphs(paragraphs, j, index))
                     if next_non_empty_paragraph is not None:
                         title.append(next_non_empty_paragraph.text)
 
@@ -287,7 +425,7 @@ class Parser:
                 elif id_ is None and normalized_text.startswith('приложение'):
                     title.append(text)
 
-                    next_non_empty_paragraph = get_first_non_empty_element(next_paragraphs)
+                    next_non_empty_paragraph = get_first_non_empty_element(get_next_paragraphs(paragraphs, j, index))
                     if next_non_empty_paragraph is not None:
                         title.append(next_non_empty_paragraph.text)
 
@@ -302,31 +440,163 @@ class Parser:
 
         return join_paragraphs(title), id_, TableType.TABLE if table_type is None else table_type
 
-    def parse_file(self, source: str, get_destination: callable = None):
+    def get_tables(self, source: str | BinaryIO):
+        if self.streaming:
+            return iterparse_tables(source), None  # paragraphs are dropped while streaming, so there is nothing to index
+
         document = Document(source)
 
         soup = BeautifulSoup(document._element.xml, 'lxml')
 
+        return soup.find_all('w:tbl'), DocumentIndex(soup)
+
+    def get_context_window(self, table: Table):
+        size = self.context_window_size
+
+        return list(islice(table.previous_sibling_paragraphs, size))[::-1], list(islice(table.next_sibling_paragraphs, size))
+
+    def parse_file(self, source: str | BinaryIO, get_destination: callable = None):
         if get_destination is None:
             stem = Path(source).stem
 
             def get_destination(i: int):
                 return f'{stem}.{i:04d}'.replace('-', '_') + '.json'
 
-        for i, table in list(enumerate(soup.find_all('w:tbl'))):
-            yield Table.from_soup(
+        tables, index = self.get_tables(source)
+
+        for i, table in enumerate(tables):
+            table = Table.from_soup(
                 table, get_destination(i)
             )
+            table.index = index
+
+            if self.compact_ids:
+                table.assign_compact_ids()
+
+            yield table
+
+    def parse_document(self, source: str, source_file: str, destination: str, entry: dict = None, member: str = None):
+        tables = []
+        records = []  # serialized tables which are written to shards by the main process
+
+        stem = Path(source_file).stem
+        xml_store = XmlStore(destination, f'{stem}.xml'.replace(' ', '_'))
+
+        try:
+            if member is None:
+                document = os.path.join(source, source_file)
+                hash_ = get_hash(document)
+            else:  # source is an archive, and the document is read from it into memory
+                data = read_member(source, member)
+                document = BytesIO(data)
+                hash_ = get_data_hash(data)
+
+            if (
+                entry is not None and entry.get('hash') == hash_ and entry.get('version') == PARSER_VERSION and entry.get('options') == self.output_options
+            ):  # entries of failed documents have no hash
+                return source_file, entry, True, None, records
+
+            with xml_store:
+                for table in self.parse_file(
+                    source = document,
+                    get_destination = lambda i: os.path.join(destination, f'{stem}.{i:04d}'.replace(' ', '_')) + '.json'
+                ):
+                    if self.sharded:
+                        records.append(dumps(table.to_json(xml_store = xml_store if self.xml_sidecar else None), compact = True))
+                    else:
+                        table.to_json(table.label, indent = self.json_indent, xml_store = xml_store if self.xml_sidecar else None)
+
+                    tables.append(os.path.basename(table.label))
+
+            sidecars = [xml_store.path] if xml_store.offset > 0 else []
+        except Exception as e:
+            return source_file, {'tables': tables, 'sidecars': [xml_store.path] if xml_store.offset > 0 else []}, False, e, []
 
-    def parse(self, source: str, destination: str):
-        indent = self.json_indent
+        return source_file, {'hash': hash_, 'version': PARSER_VERSION, 'options': self.output_options, 'tables': tables, 'sidecars': sidecars}, False, None, records
 
+    def parse(self, source: str, destination: str, workers: int = 1, force: bool = False):
         if not os.path.isdir(destination):
             os.makedirs(destination)
 
-        for source_file in tqdm(os.listdir(source)):
-            for table in self.parse_file(
-                source = os.path.join(source, source_file),
-                get_destination = lambda i: os.path.join(destination, f'{Path(source_file).stem}.{i:04d}'.replace(' ', '_')) + '.json'
-            ):
-                table.to_json(table.label, indent = indent)
+        if is_archive(source):
+            members = list_members(source)
+            source_files = list(members)
+        else:
+            members = {}
+            source_files = os.listdir(source)
+
+        manifest = Manifest.from_dir(destination)
+
+        if len(manifest.entries) > 0 and is_sharded(destination) != self.sharded:  # readers would see only one of the layouts
+            if not force:
+                raise ValueError(
+                    f'Tables in {destination} are kept {"in shards" if is_sharded(destination) else "one file per table"}, '
+                    'parse with force (--force) to replace them or choose another destination'
+                )
+
+            manifest.clear()
+            remove_shards(destination)
+
+        if len(removed_source_files := manifest.remove_missing(source_files)) > 0:
+            print(f'Removed outputs of {len(removed_source_files)} documents which are no longer present in {source}')
+
+        n_documents = 0
+        n_tables = 0
+        n_failed_documents = 0
+        n_skipped_documents = 0
+
+        start = time()
+
+        def parse_documents():
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers = workers) as executor:
+                    futures = [
+                        executor.submit(self.parse_document, source, source_file, destination, None if force else manifest.get(source_file), members.get(source_file))
+                        for source_file in source_files
+                    ]
+
+                    for future in as_completed(futures):
+                        yield future.result()
+            else:
+                for source_file in source_files:
+                    yield self.parse_document(source, source_file, destination, None if force else manifest.get(source_file), members.get(source_file))
+
+        store = ShardStore(destination, self.max_shard_size, self.compress) if self.sharded else None
+
+        try:
+            for source_file, entry, skipped, error, records in tqdm(parse_documents(), total = len(source_files)):
+                if skipped:
+                    n_skipped_documents += 1
+                    continue
+
+                n_tables += len(entry['tables'])
+
+                if error is None:
+                    n_documents += 1
+                    manifest.update(source_file, entry)
+
+                    if store is not None:
+                        for table, record in zip(entry['tables'], records):
+                            store.write(table, record)
+                else:
+                    n_failed_documents += 1
+                    manifest.forget(source_file, entry)
+                    print(f'Error when parsing file {source_file}: {error}. Skipping...')
+        finally:
+            close_archives()
+            manifest.save()
+
+            if store is not None:
+                store.retain({table for entry in manifest.entries.values() for table in entry['tables']})
+                store.close()
+
+        elapsed = time() - start
+
+        print(
+            f'Parsed {n_tables} tables from {n_documents} documents ({n_failed_documents} failed, {n_skipped_documents} unchanged) in {elapsed:.3f} seconds: '
+            f'{(n_documents + n_failed_documents) / elapsed:.3f} docs/sec, {n_tables / elapsed:.3f} tables/sec'
+        )
+
+        if self.search_index or os.path.isfile(os.path.join(destination, SEARCH_INDEX_FILENAME)):
+            with SearchIndex(destination) as index:
+                print(f'Indexed {index.update(workers)} new or modified tables for search')
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from math import ceil, log, nan, sqrt
+from typing import Iterable
+
+from numpy import array, float64, ceil as np_ceil, log as np_log, unique
+
+
+DEFAULT_RELATIVE_ERROR = 0.01
+
+
+class QuantileSketch:
+    # Values are counted in logarithmic buckets, so that any quantile is estimated with the given relative error, and sketches built over
+    # different parts of the data can be merged. The number of buckets depends only on the range of values, not on how many of them were added.
+    # Exact count, sum, min, max and variance are kept alongside
+
+    def __init__(self, relative_error: float = DEFAULT_RELATIVE_ERROR):
+        self.relative_error = relative_error
+
+        self._gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = log(self._gamma)
+
+        self._positive = {}  # bucket key -> number of values
+        self._negative = {}  # the same for absolute values of negative numbers
+        self._n_zeros = 0
+
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+        self._mean = 0.0
+        self._m2 = 0.0  # sum of squared deviations from the mean
+
+    def _add_buckets(self, buckets: dict, values):
+        keys, counts = unique(np_ceil(np_log(values) / self._log_gamma).astype(int), return_counts = True)
+
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+
+    def _add_moments(self, count: int, sum_: float, mean: float, m2: float):
+        delta = mean - self._mean
+        total = self.count + count
+
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self._mean += delta * count / total
+
+        self.count = total
+        self.sum += sum_
+
+    def extend(self, values: Iterable[float]):
+        if len(values := array(values)) < 1:
+            return
+
+        sum_ = values.sum().item()  # exact for integer values
+        values = values.astype(float64)
+
+        self._add_buckets(self._positive, values[values > 0])
+        self._add_buckets(self._negative, -values[values < 0])
+        self._n_zeros += int((values == 0).sum())
+
+        min_ = values.min().item()
+        max_ = values.max().item()
+
+        self.min = min_ if self.min is None else min(self.min, min_)
+        self.max = max_ if self.max is None else max(self.max, max_)
+
+        mean = values.mean().item()
+
+        self._add_moments(len(values), sum_, mean, ((values - mean) ** 2).sum().item())
+
+    def append(self, value: float):
+        self.extend((value, ))
+
+    def merge(self, other: QuantileSketch):
+        if other.relative_error != self.relative_error:
+            raise ValueError('Sketches with different relative errors can not be merged')
+
+        if other.count < 1:
+            return self
+
+        for buckets, other_buckets in ((self._positive, other._positive), (self._negative, other._negative)):
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+
+        self._n_zeros += other._n_zeros
+
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+        self._add_moments(other.count, other.sum, other._mean, other._m2)
+
+        return self
+
+    @property
+    def mean(self):
+        return nan if self.count < 1 else self._mean
+
+    @property
+    def std(self):
+        return nan if self.count < 2 else sqrt(self._m2 / (self.count - 1))
+
+    def _value_at(self, rank: int):  # estimate of the value which would be at the given position if all values were sorted
+        if rank < 1:
+            return self.min
+
+        if rank >= self.count - 1:
+            return self.max
+
+        for key in sorted(self._negative, reverse = True):
+            if (rank := rank - self._negative[key]) < 0:
+                return -2 * self._gamma ** key / (self._gamma + 1)
+
+        if (rank := rank - self._n_zeros) < 0:
+            return 0
+
+        for key in sorted(self._positive):
+            if (rank := rank - self._positive[key]) < 0:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+
+        return self.max
+
+    def quantile(self, q: float):  # interpolates between the neighbouring ranks as numpy.percentile does
+        if self.count < 1:
+            return nan
+
+        rank = q * (self.count - 1)
+        lower = int(rank)
+
+        lower_value = self._value_at(lower)
+
+        if (fraction := rank - lower) == 0:
+            return lower_value
+
+        return lower_value + (self._value_at(ceil(rank)) - lower_value) * fraction
+
+    def percentile(self, percents: Iterable[float]):
+        return [self.quantile(percent / 100) for percent in percents]
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,220 @@
+import os
+import sqlite3
+from bisect import bisect_right
+from math import log
+
+from .util import tokenize, encode_positions, decode_positions
+from .util.serialization import dumps, loads
+from .Table import Table
+from .Tables import DEFAULT_PREFETCH, load_tables
+from .ShardStore import list_tables, get_fingerprint
+
+
+SEARCH_INDEX_FILENAME = '.search.sqlite'
+
+FIELD_GAP = 1  # positions skipped between fields, so that a phrase never spans two cells
+DEFAULT_LIMIT = 10
+BATCH_SIZE = 500  # sqlite limits the number of query parameters
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    doc INTEGER PRIMARY KEY,
+    label TEXT UNIQUE NOT NULL,
+    fingerprint TEXT NOT NULL,
+    n_tokens INTEGER NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+'''
+
+
+def get_context_text(context: str | dict):
+    if isinstance(context, dict):
+        return ' '.join(value for value in context.values() if isinstance(value, str))
+
+    return context
+
+
+def get_fields(table: Table):  # (kind, text, location) of every searchable text, cells are located by their top left corner and spans
+    if table.title is not None:
+        yield 'title', table.title, []
+
+    for i, context in enumerate([] if table.contexts is None else table.contexts):
+        yield 'context', get_context_text(context if isinstance(context, (str, dict)) else context.json), [i]
+
+    for row, col, cell in table.cell_index.origins:
+        yield 'cell', cell.text, [row, col, cell.n_rows, cell.n_cols]
+
+
+def index_table(table: Table):  # number of tokens, fields as [first position, kind, *location] and positions of every term
+    fields = []
+    positions = {}
+
+    position = 0
+    n_tokens = 0
+
+    for kind, text, location in get_fields(table):
+        if text is None or len(tokens := tokenize(text)) < 1:
+            continue
+
+        fields.append([position, kind, *location])
+
+        for token in tokens:
+            positions.setdefault(token, []).append(position)
+            position += 1
+
+        n_tokens += len(tokens)
+        position += FIELD_GAP
+
+    return n_tokens, fields, positions
+
+
+def find_phrases(positions: list[list[int]]):  # start positions at which the terms follow each other
+    following = [set(term_positions) for term_positions in positions[1:]]
+
+    return [start for start in positions[0] if all(start + i in term_positions for i, term_positions in enumerate(following, start = 1))]
+
+
+class SearchIndex:  # inverted index over cell texts, titles and contexts of all tables in a directory with positional postings compressed as varints
+    def __init__(self, path: str):
+        self.path = path
+
+        self._connection = sqlite3.connect(os.path.join(path, SEARCH_INDEX_FILENAME))
+        self._connection.executescript(SCHEMA)
+
+    def _remove(self, doc: int):
+        self._connection.execute('DELETE FROM postings WHERE doc = ?', (doc, ))
+
+    def _add(self, table: Table, fingerprint: str, doc: int = None):
+        n_tokens, fields, positions = index_table(table)
+
+        if doc is None:
+            doc = self._connection.execute(
+                'INSERT INTO documents (label, fingerprint, n_tokens, fields) VALUES (?, ?, ?, ?)', (table.label, fingerprint, n_tokens, dumps(fields, compact = True))
+            ).lastrowid
+        else:
+            self._remove(doc)
+            self._connection.execute(
+                'UPDATE documents SET fingerprint = ?, n_tokens = ?, fields = ? WHERE doc = ?', (fingerprint, n_tokens, dumps(fields, compact = True), doc)
+            )
+
+        self._connection.executemany(
+            'INSERT INTO postings (term, doc, positions) VALUES (?, ?, ?)',
+            [(term, doc, encode_positions(term_positions)) for term, term_positions in positions.items()]
+        )
+
+    def update(self, workers: int = 1, prefetch: int = DEFAULT_PREFETCH):  # returns the number of tables which were indexed
+        locations = dict(list_tables(self.path))
+        fingerprints = {label: dumps(get_fingerprint(self.path, location)) for label, location in locations.items()}
+
+        indexed = {label: (doc, fingerprint) for doc, label, fingerprint in self._connection.execute('SELECT doc, label, fingerprint FROM documents')}
+
+        stale_locations = [(label, location) for label, location in locations.items() if label not in indexed or indexed[label][1] != fingerprints[label]]
+
+        with self._connection:
+            for label, (doc, _) in indexed.items():
+                if label not in locations:
+                    self._remove(doc)
+                    self._connection.execute('DELETE FROM documents WHERE doc = ?', (doc, ))
+
+            for table in load_tables(self.path, stale_locations, grid = True, workers = workers, prefetch = prefetch):
+                self._add(table, fingerprints[table.label], indexed.get(table.label, (None, ))[0])
+
+        return len(stale_locations)
+
+    def _get_documents(self, docs: list[int]):
+        documents = {}
+
+        for i in range(0, len(docs), BATCH_SIZE):
+            batch = docs[i:i + BATCH_SIZE]
+
+            for doc, label, n_tokens, fields in self._connection.execute(
+                f'SELECT doc, label, n_tokens, fields FROM documents WHERE doc IN ({", ".join("?" for _ in batch)})', batch
+            ):
+                documents[doc] = (label, n_tokens, fields)
+
+        return documents
+
+    def search(self, query: str, phrase: bool = False, limit: int = DEFAULT_LIMIT):
+        # Tables which contain all terms of the query (or the whole query as a phrase) ranked by bm25, each with the fields in which the terms occur,
+        # as (label, score, [(kind, *location, number of matches)]), cells being located by (row, col, n_rows, n_cols) with spans resolved
+
+        if len(terms := tokenize(query)) < 1:
+            return []
+
+        postings = {
+            term: dict(self._connection.execute('SELECT doc, positions FROM postings WHERE term = ?', (term, )))
+            for term in dict.fromkeys(terms)
+        }
+
+        n_documents, mean_length = self._connection.execute('SELECT count(*), avg(n_tokens) FROM documents').fetchone()
+
+        docs = set.intersection(*(set(term_postings) for term_postings in postings.values()))
+
+        matches = {}  # doc -> positions of matched tokens
+        frequencies = {}  # doc -> term -> number of occurrences, the phrase being counted as a single term
+
+        for doc in docs:
+            positions = {term: decode_positions(term_postings[doc]) for term, term_postings in postings.items()}
+
+            if phrase:
+                if len(starts := find_phrases([positions[term] for term in terms])) > 0:
+                    matches[doc] = starts
+                    frequencies[doc] = {query: len(starts)}
+            else:
+                matches[doc] = sorted(position for term_positions in positions.values() for position in term_positions)
+                frequencies[doc] = {term: len(term_positions) for term, term_positions in positions.items()}
+
+        document_frequencies = {query: len(matches)} if phrase else {term: len(term_postings) for term, term_postings in postings.items()}
+
+        documents = self._get_documents(list(matches))
+
+        def score(doc: int):
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * documents[doc][1] / mean_length)
+
+            return sum(
+                log(1 + (n_documents - document_frequencies[term] + 0.5) / (document_frequencies[term] + 0.5)) * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+                for term, frequency in frequencies[doc].items()
+            )
+
+        results = []
+
+        for doc, doc_score in sorted(((doc, score(doc)) for doc in matches), key = lambda item: (-item[1], documents[item[0]][0]))[:limit]:
+            label, _, fields = documents[doc]
+
+            fields = loads(fields)
+            starts = [field[0] for field in fields]
+
+            n_matches = {}
+
+            for position in matches[doc]:
+                i = bisect_right(starts, position) - 1
+                n_matches[i] = n_matches.get(i, 0) + 1
+
+            results.append(
+                (
+                    label,
+                    doc_score,
+                    [(*fields[i][1:], count) for i, count in sorted(n_matches.items(), key = lambda item: (-item[1], item[0]))]
+                )
+            )
+
+        return results
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,179 @@
+import os
+import re
+
+from .util.serialization import load, loads
+
+
+SHARD_INDEX_FILENAME = '.shards.tsv'
+SHARD_NAME_TEMPLATE = 'tables.{index:05d}.jsonl'
+SHARD_NAME_PATTERN = re.compile(r'tables\.([0-9]+)\.jsonl(?:\.zst)?')
+COMPRESSED_SHARD_SUFFIX = '.zst'
+DEFAULT_MAX_SHARD_SIZE = 64 * 1024 * 1024
+
+
+def is_sharded(path: str):
+    return os.path.isfile(os.path.join(path, SHARD_INDEX_FILENAME))
+
+
+def remove_shards(path: str):  # deletes all shards and the index, so that the directory is read as one file per table again
+    for name in os.listdir(path):
+        if SHARD_NAME_PATTERN.fullmatch(name) is not None or name == SHARD_INDEX_FILENAME:
+            os.remove(os.path.join(path, name))
+
+
+def read_tables(path: str):  # (label, json) pairs for a directory with one file per table as well as for a sharded directory
+    if is_sharded(path):
+        yield from ShardStore(path).items()
+        return
+
+    for filename in os.listdir(path):
+        if filename.startswith('.'):  # manifest and other service files
+            continue
+
+        with open(os.path.join(path, filename), 'rb') as file:
+            yield filename, load(file)
+
+
+def list_tables(path: str):  # (label, location) pairs in the order of read_tables, a location is enough to read the table with read_table
+    if is_sharded(path):
+        yield from sorted(ShardStore(path).index.items(), key = lambda item: item[1])
+        return
+
+    for filename in os.listdir(path):
+        if not filename.startswith('.'):
+            yield filename, filename
+
+
+def read_table(path: str, location: str | tuple[str, int, int]):
+    if isinstance(location, str):
+        with open(os.path.join(path, location), 'rb') as file:
+            return load(file)
+
+    shard, offset, length = location
+
+    with open(os.path.join(path, shard), 'rb') as file:
+        file.seek(offset)
+
+        return decode(shard, file.read(length))
+
+
+def get_fingerprint(path: str, location: str | tuple[str, int, int]):  # changes whenever the file which keeps the table is rewritten
+    if isinstance(location, str):
+        stat = os.stat(os.path.join(path, location))
+
+        return [stat.st_mtime_ns, stat.st_size]
+
+    shard, offset, length = location
+    stat = os.stat(os.path.join(path, shard))
+
+    return [stat.st_mtime_ns, stat.st_size, shard, offset, length]
+
+
+def decode(shard: str, data: bytes):
+    if shard.endswith(COMPRESSED_SHARD_SUFFIX):
+        from zstandard import ZstdDecompressor
+
+        data = ZstdDecompressor().decompress(data)
+
+    return loads(data)
+
+
+class ShardStore:  # tables serialized as newline-delimited json records in size-bounded shards, optionally each record being a separate zstd frame
+    def __init__(self, path: str, max_shard_size: int = DEFAULT_MAX_SHARD_SIZE, compress: bool = False):
+        self.path = path
+        self.max_shard_size = max_shard_size
+        self.compress = compress
+
+        self.index = {}  # label -> (shard, offset, length)
+
+        if os.path.isfile(index_path := os.path.join(path, SHARD_INDEX_FILENAME)):
+            with open(index_path, 'r', encoding = 'utf-8') as file:
+                for line in file:
+                    label, shard, offset, length = line[:-1].split('\t')
+                    self.index[label] = (shard, int(offset), int(length))
+
+        self._file = None
+        self._shard = None
+        self._shard_size = 0
+        self._compressor = None
+
+    @property
+    def labels(self):
+        return list(self.index)
+
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+
+        indices = [int(match.group(1)) for name in os.listdir(self.path) if (match := SHARD_NAME_PATTERN.fullmatch(name)) is not None]
+
+        self._shard = SHARD_NAME_TEMPLATE.format(index = max(indices, default = -1) + 1)
+
+        if self.compress:
+            self._shard += COMPRESSED_SHARD_SUFFIX
+
+        self._file = open(os.path.join(self.path, self._shard), 'wb')
+        self._shard_size = 0
+
+    def write(self, label: str, record: str):
+        data = f'{record}\n'.encode('utf-8')
+
+        if self.compress:
+            if self._compressor is None:
+                from zstandard import ZstdCompressor
+
+                self._compressor = ZstdCompressor()
+
+            data = self._compressor.compress(data)
+
+        if self._file is None or self._shard_size > 0 and self._shard_size + len(data) > self.max_shard_size:
+            self._next_shard()
+
+        self._file.write(data)
+
+        self.index[label] = (self._shard, self._shard_size, len(data))
+        self._shard_size += len(data)
+
+    def read(self, label: str):
+        return read_table(self.path, self.index[label])
+
+    def items(self):  # records are read shard by shard in the order in which they were written
+        shards = {}
+
+        for label, (shard, offset, length) in self.index.items():
+            shards.setdefault(shard, []).append((offset, length, label))
+
+        for shard, records in sorted(shards.items()):
+            with open(os.path.join(self.path, shard), 'rb') as file:
+                for offset, length, label in sorted(records):
+                    file.seek(offset)
+
+                    yield label, decode(shard, file.read(length))
+
+    def retain(self, labels: set):  # drop records of removed tables from the index and delete shards which are no longer referenced
+        self.index = {label: location for label, location in self.index.items() if label in labels}
+
+        referenced_shards = {shard for shard, _, _ in self.index.values()}
+
+        for name in os.listdir(self.path):
+            if SHARD_NAME_PATTERN.fullmatch(name) is not None and name not in referenced_shards and name != self._shard:
+                os.remove(os.path.join(self.path, name))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        index_path = os.path.join(self.path, SHARD_INDEX_FILENAME)
+
+        with open(tmp_index_path := f'{index_path}.tmp', 'w', encoding = 'utf-8') as file:
+            for label, (shard, offset, length) in self.index.items():
+                file.write(f'{label}\t{shard}\t{offset}\t{length}\n')
+
+        os.replace(tmp_index_path, index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,102 @@
+import os
+
+from .util.serialization import dump, load
+from .Table import TableStats
+from .Tables import TablesStats, DEFAULT_PREFETCH, load_tables
+from .ColumnarStats import ColumnarStats
+from .ShardStore import list_tables, get_fingerprint
+from .QuantileSketch import DEFAULT_RELATIVE_ERROR
+
+
+STATS_CACHE_FILENAME = '.stats.json'
+STATS_CACHE_VERSION = 2
+
+
+class StatsCache:  # keeps stats and serialized size of every table in a directory, so that only new and modified tables are loaded on the next run
+    def __init__(self, path: str, entries: dict = None):
+        self.path = path
+        self.entries = {} if entries is None else entries  # label -> {'fingerprint', 'n_chars', 'stats', 'features'}, in the order of listing
+
+    @classmethod
+    def from_dir(cls, path: str):
+        if os.path.isfile(cache_path := os.path.join(path, STATS_CACHE_FILENAME)):
+            with open(cache_path, 'rb') as file:
+                if (data := load(file)).get('version') == STATS_CACHE_VERSION:
+                    return cls(path, data['entries'])
+
+        return cls(path)
+
+    def update(self, workers: int = 1, prefetch: int = DEFAULT_PREFETCH):  # returns the number of tables which were loaded
+        locations = list(list_tables(self.path))
+        fingerprints = {label: get_fingerprint(self.path, location) for label, location in locations}
+
+        stale_locations = [
+            (label, location)
+            for label, location in locations
+            if (entry := self.entries.get(label)) is None or entry['fingerprint'] != fingerprints[label]
+        ]
+
+        updated_entries = {}
+
+        def add_entries(tables):
+            # tables are passed through to ColumnarStats, so that every one is loaded once. Stats materialize rows of the table and drop its grid,
+            # so they are computed only after ColumnarStats has taken the features from the grid
+
+            for table in tables:
+                yield table
+
+                updated_entries[table.label] = {
+                    'fingerprint': fingerprints[table.label],
+                    'n_chars': table.n_chars,
+                    'stats': table.stats.to_json()
+                }
+
+        columns = ColumnarStats.from_tables(add_entries(load_tables(self.path, stale_locations, grid = True, workers = workers, prefetch = prefetch)))
+
+        for label, features in zip(columns.labels, columns.as_df.values.tolist()):  # same features as stats --no-cache --save computes
+            updated_entries[label]['features'] = features
+
+        self.entries = {
+            label: updated_entries[label] if label in updated_entries else self.entries[label]
+            for label, _ in locations
+        }
+
+        return len(stale_locations)
+
+    @property
+    def labels(self):
+        return list(self.entries)
+
+    def items(self):  # (label, stats, serialized size) for every table
+        for label, entry in self.entries.items():
+            yield label, TableStats.from_json(entry['stats']), entry['n_chars']
+
+    def get_stats(self, streaming: bool = False, relative_error: float = DEFAULT_RELATIVE_ERROR):  # same as Tables.non_trivial.stats
+        base_stats = TablesStats(streaming = streaming, relative_error = relative_error)
+        stats = TablesStats(base_stats = base_stats, streaming = streaming, relative_error = relative_error)
+
+        for _, table_stats, n_chars in self.items():
+            base_stats.add_stats(table_stats, n_chars)
+
+            if table_stats.is_non_trivial:
+                stats.add_stats(table_stats, n_chars)
+
+        return stats
+
+    def get_features(self):  # normalized feature vectors of non-trivial tables along with their labels, as written by stats --save
+        labels, vectors = [], []
+
+        for label, table_stats, _ in self.items():
+            if table_stats.is_non_trivial:
+                labels.append(label)
+                vectors.append(self.entries[label]['features'])
+
+        return labels, TablesStats.normalize(vectors)
+
+    def save(self):
+        cache_path = os.path.join(self.path, STATS_CACHE_FILENAME)
+
+        with open(tmp_cache_path := f'{cache_path}.tmp', 'w', encoding = 'utf-8') as file:
+            dump({'version': STATS_CACHE_VERSION, 'entries': self.entries}, file, compact = True)
+
+        os.replace(tmp_cache_path, cache_path)
@@ -1,20 +1,71 @@
-import json
-from typing import ClassVar
+from typing import ClassVar, Callable, BinaryIO, Iterable, Iterator
+from functools import partial
+from bisect import bisect_right
+from itertools import repeat
+from collections import Counter
 import re
 
 from numpy import mean
 from docx.table import Table as TableDocx
 from bs4 import BeautifulSoup
 
-from .util import is_number, drop_space_around_punctuation, normalize_spaces, is_bold
-from .Cell import Cell
+from .util import is_number, normalize_spaces, normalize_texts, is_bold
+from .util.serialization import dump, dumps
+from .Cell import Cell, Placeholder
 from .Item import Item
 from .TableType import TableType
+from .XmlStore import XmlStore
+from .TableGrid import TableGrid
 
 
 NOTE_PATTERN = re.compile(r'([*]+)\s+([^*]+[^*\s])')
 
 
+# Parse notes - just add the note text in brackets after the original cell content without removing the anchor symbol(s).
+# Anchors consist of asterisks only, so the longest anchor which is a suffix of the cell text is the longest one not exceeding the number of trailing asterisks
+
+def resolve_notes(rows: list[list[Cell]]):
+    notes = {}
+
+    for row in rows:
+        for cell in row:
+            if (text := cell.text) is not None and '*' in text:
+                for note in NOTE_PATTERN.findall(text):
+                    notes[len(note[0])] = note[1]
+
+    if len(notes) < 1:
+        return 0
+
+    anchor_lengths = sorted(notes)
+    n_annotated_cells = 0
+
+    for row in rows:
+        for cell in row:
+            if (text := cell.text) is not None and text.endswith('*'):
+                if (i := bisect_right(anchor_lengths, len(text) - len(text.rstrip('*')))) > 0:
+                    cell.text = f'{text} ({notes[anchor_lengths[i - 1]]})'  # cell texts and notes are already normalized
+                    n_annotated_cells += 1
+
+    return n_annotated_cells
+
+
+def get_total_n_chars(json: dict, label: str, root: str = '.'):
+    # serialized size of the table as to_json writes it without an xml store - with the label and the xml inlined, and the size of serialized pairs
+    # does not depend on their order. Xml kept in the sidecar store adds one more pair to the object
+
+    n_chars = len(dumps({key: value for key, value in json.items() if key != 'xml_ref'} | {'label': label}))
+
+    if (xml_ref := json.get('xml_ref')) is not None:
+        n_chars += len(dumps({'xml': XmlStore.read(root, xml_ref)}))
+
+    return n_chars
+
+
+def normalize_cell_texts(cells: list[Cell]):
+    for cell, text in zip(cells, normalize_texts([cell.text for cell in cells])):
+        cell.text = text
+
+
 def get_aligned_cell(cells: list[Cell], col_offset: int):
     n_cols = 0
 
@@ -27,30 +78,122 @@ def get_aligned_cell(cells: list[Cell], col_offset: int):
     return cell
 
 
+class CellIndex:  # maps every logical grid position (row, col) to the origin cell which occupies it, with row and column spans applied
+    def __init__(self, rows: list[list[Cell]]):
+        self.grid = []
+        self.origins = []  # (row, col, cell) of the top left corner of every origin cell in the order of appearance
+        self.n_cols = 0
+
+        for row in rows:
+            self.add_row(row)
+
+    @property
+    def n_rows(self):
+        return len(self.grid)
+
+    def add_row(self, row: list[Cell]):  # rows can be added while the table is being built, e.g. to resolve vertical merges of the next row
+        line = []
+
+        for cell in row:
+            if not isinstance(cell, Placeholder):
+                self.origins.append((self.n_rows, len(line), cell))
+
+            line.extend(repeat(cell.origin if isinstance(cell, Placeholder) else cell, cell.n_cols))
+
+        self.grid.append(line)
+        self.n_cols = max(self.n_cols, len(line))
+
+    def cell_at(self, row: int, col: int):
+        if 0 <= row < self.n_rows and 0 <= col < len(line := self.grid[row]):
+            return line[col]
+
+        return None
+
+    def origin_starting_at(self, row: int, col: int):  # the origin cell if one of the cells of the row starts at the column, otherwise None
+        if (cell := self.cell_at(row, col)) is not None and (col < 1 or self.grid[row][col - 1] is not cell):
+            return cell
+
+        return None
+
+    def column(self, col: int):
+        return [self.cell_at(row, col) for row in range(self.n_rows)]
+
+    def cells_at(self, coordinates: list[tuple[int, int]]):  # e.g. highlighted_cell_ids from FeTaQA samples
+        return [self.cell_at(row, col) for row, col in coordinates]
+
+
+def iterate_normacs_rows(events: Iterator[tuple], prefix: str):  # build rows of the table one at a time from the stream of ijson events
+    from ijson import ObjectBuilder
+
+    item_prefix = f'{prefix}.item'
+    builder = None
+
+    for prefix_, event, value in events:
+        if builder is not None:
+            builder.event(event, value)
+
+            if prefix_ == item_prefix and event == 'end_map':
+                if isinstance(row := builder.value, dict) and 'cells' in row:
+                    yield row
+
+                builder = None
+        elif prefix_ == item_prefix and event == 'start_map':
+            builder = ObjectBuilder()
+            builder.event(event, value)
+        elif prefix_ == prefix and event == 'end_array':
+            return
+
+
 class Table(Item):
     type_label: ClassVar[str] = 'table'
 
-    def __init__(self, soup: BeautifulSoup, rows: list[list[Cell]], label: str):
-        self.rows = rows
-        self.soup = soup
+    def __init__(self, soup: BeautifulSoup, rows: list[list[Cell]], label: str, xml: str | Callable[[], str] = None, grid: TableGrid = None):
+        self._rows = rows
+        self._grid = grid  # compact representation of rows, which are materialized only when accessed
         self.label = label
 
+        self._soup = soup
+        self._xml = xml  # raw xml or a function which reads it from the sidecar store, parsed only when soup is accessed
+
         self.contexts = None
         self.title = None
         self.id = None
         self.type = None
 
+        self.index = None  # paragraphs of the source document, see DocumentIndex
+
+        self._cell_index = None
+
         self._stats = None
+        self._n_chars = None  # serialized size, measured when first requested unless the binary store has recorded it
 
     @classmethod
     def from_normacs_json(cls, json: dict):
+        return cls.from_normacs_rows(json['rows'])
+
+    @classmethod
+    def from_normacs_stream(cls, file: BinaryIO):  # yields tables one by one without loading the whole document into memory
+        from ijson import parse
+
+        events = parse(file)
+
+        for _, event, value in events:
+            if event == 'map_key' and value == 'rows':
+                prefix, event, _ = next(events)
+
+                if event == 'start_array' and len((table := cls.from_normacs_rows(iterate_normacs_rows(events, prefix))).rows) > 0:
+                    yield table
+
+    @classmethod
+    def from_normacs_rows(cls, normacs_rows: Iterable[dict]):
         rows = []
+        cells = []
 
         offset_to_cell_id = {}
         cell_id_to_n_remaining_rows = {}
         cell_id_to_cell = {}
 
-        for row in json['rows']:
+        for row in normacs_rows:
             row_ = []
             offset = 0
 
@@ -91,15 +234,12 @@ class Table(Item):
 
                 row_.append(
                     cell := Cell(
-                        drop_space_around_punctuation(
-                            normalize_spaces(
-                                ' '.join(inlines)
-                            )
-                        ),
+                        ' '.join(inlines),  # normalized below together with the rest of the table
                         n_rows = n_rows,
                         n_cols = n_cols
                     )
                 )
+                cells.append(cell)
 
                 if n_rows > 1:
                     cell_id_to_cell[cell.id] = cell
@@ -110,6 +250,8 @@ class Table(Item):
 
             rows.append(row_)
 
+        normalize_cell_texts(cells)
+
         # for row in rows:
         #     print(row)
 
@@ -120,24 +262,88 @@ class Table(Item):
         )
 
     @classmethod
-    def from_json(cls, json: dict, make_context: callable, label: str = None):
+    def from_json(cls, json: dict, make_context: callable = None, label: str = None, root: str = None, grid: bool | TableGrid = False):
+        # grid may also be a ready TableGrid (e.g. a view over the binary store), then json provides only the metadata and is not measured
+
         if label is None:
             label = json.get('label')
 
-        xml = json.get('xml')
-        rows = Cell.deserialize_rows(json['rows'])
-        table = cls(BeautifulSoup(xml, 'lxml'), rows = rows, label = label)
+        if (xml := json.get('xml')) is None and (xml_ref := json.get('xml_ref')) is not None:
+            xml = partial(XmlStore.read, '.' if root is None else root, xml_ref)
+
+        if isinstance(grid, TableGrid):
+            return cls._set_metadata(cls(None, rows = None, label = label, xml = xml, grid = grid), json, make_context)
+
+        if grid:
+            table = cls(None, rows = None, label = label, xml = xml, grid = TableGrid.from_json(json['rows']))
+        else:
+            table = cls(None, rows = Cell.deserialize_rows(json['rows']), label = label, xml = xml)
+
+        return cls._set_metadata(table, json, make_context)  # n_chars is measured from to_json only when requested
 
+    @staticmethod
+    def _set_metadata(table: 'Table', json: dict, make_context: callable = None):
         table.id = json.get('id')
-        table.type = TableType(json.get('type'))
+        table.type = None if (type_ := json.get('type')) is None else TableType(type_)
         table.title = json.get('title')
-        table.contexts = [
-            make_context(context)
-            for context in json.get('contexts')
-        ]
+
+        if (contexts := json.get('contexts')) is not None:
+            table.contexts = contexts if make_context is None else [
+                make_context(context)
+                for context in contexts
+            ]
 
         return table
 
+    @property
+    def rows(self):
+        if self._rows is None and self._grid is not None:
+            self._rows = self._grid.to_rows()
+            self._grid = None  # rows may be modified, so the grid is no longer valid
+
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows: list[list[Cell]]):
+        self._rows = rows
+        self._grid = None
+        self._cell_index = None
+        self._n_chars = None
+
+    @property
+    def cell_index(self):
+        if self._cell_index is None:
+            self._cell_index = CellIndex(self.rows)
+
+        return self._cell_index
+
+    def cell_at(self, row: int, col: int):
+        return self.cell_index.cell_at(row, col)
+
+    def column(self, col: int):
+        return self.cell_index.column(col)
+
+    def cells_at(self, coordinates: list[tuple[int, int]]):
+        return self.cell_index.cells_at(coordinates)
+
+    @property
+    def soup(self):
+        if self._soup is None and (xml := self.xml) is not None:
+            self._soup = BeautifulSoup(xml, 'lxml')
+            self._xml = None
+
+        return self._soup
+
+    @property
+    def xml(self):
+        if self._soup is not None:
+            return str(self._soup)
+
+        if callable(self._xml):
+            self._xml = self._xml()
+
+        return self._xml
+
     def set_title(self, text: str = None):
         bold_text = [] if text is None else None
 
@@ -156,18 +362,23 @@ class Table(Item):
     @classmethod
     def from_soup(cls, soup: BeautifulSoup, label: str):
         rows = []
+        new_cells = []
         last_row = None
 
+        index = CellIndex([])  # grid of the rows built so far, which gives the cell above a vertically merged one
+
         for row in soup.find_all('w:tr'):
             cells = []
 
             col_offset = 0
 
             for cell in row.find_all('w:tc'):
-
                 if last_row is not None and (vertical_span := cell.find('w:vmerge')) is not None and vertical_span.get('w:val') != 'restart':
+                    if (aligned_cell := index.origin_starting_at(index.n_rows - 1, col_offset)) is None:  # cells of adjacent rows are not aligned
+                        aligned_cell = get_aligned_cell(last_row, col_offset)
+
                     cells.append(
-                        placeholder := get_aligned_cell(last_row, col_offset).make_placeholder()
+                        placeholder := aligned_cell.make_placeholder()
                     )
 
                     (origin := placeholder.origin).n_rows += 1
@@ -181,46 +392,48 @@ class Table(Item):
                     col_offset += n_cols
 
                     cells.append(
-                        Cell(
-                            drop_space_around_punctuation(
-                                normalize_spaces(cell.text)
-                            ),
+                        new_cell := Cell(
+                            cell.text,  # normalized below together with the rest of the table
                             n_cols = n_cols
                         )
                     )
+                    new_cells.append(new_cell)
 
             last_row = cells
             rows.append(cells)
+            index.add_row(cells)
 
-        # Parse notes - just add the note text in brackets after the original cell content without removing the anchor symbol(s)
+        normalize_cell_texts(new_cells)
+        resolve_notes(rows)
 
-        notes = {}
+        table = cls(soup, rows, label)
+        table._cell_index = index  # texts are normalized in place, so the index stays valid
 
-        # if rows[0][0].text.startswith('Сооружения'):
+        return table
 
-        for row in rows:
-            for cell in row:
-                if cell.text is not None:
-                    for note in NOTE_PATTERN.findall(cell.text):
-                        notes[note[0]] = note[1]
+    def assign_compact_ids(self):  # number cells in the order of appearance, so that ids are short and do not change between runs
+        i = 0
 
-        for row in rows:
+        for row in self.rows:
             for cell in row:
-                for key in sorted(notes.keys(), key = lambda key: len(key), reverse = True):
-                    if cell.text is not None and cell.text.endswith(key):
-                        # cell.text = f'{cell.text.strip()[:-(len(key) + 2)]} ({value})'
-                        cell.text = normalize_spaces(f'{cell.text} ({notes[key]})')
+                if isinstance(cell, Cell):  # placeholders refer to the id of the origin cell
+                    cell.id = i
+                    i += 1
 
-        return cls(soup, rows, label)
+        self._n_chars = None
 
-    def to_json(self, path: str = None, indent: int = 2):
-        data = Cell.serialize_rows(self.rows)
+    def to_json(self, path: str = None, indent: int = 2, xml_store: XmlStore = None):
+        data = Cell.serialize_rows(self.rows) if self._grid is None else self._grid.serialize_rows()
 
         data['label'] = self.label
-        data['xml'] = str(self.soup)
+
+        if xml_store is None or (xml := self.xml) is None:
+            data['xml'] = self.xml
+        else:
+            data['xml_ref'] = xml_store.write(xml)
 
         if (contexts := self.contexts) is not None:
-            data['contexts'] = [context.json for context in contexts]
+            data['contexts'] = [context if isinstance(context, dict) else context.json for context in contexts]
 
         if (title := self.title) is not None:
             data['title'] = title
@@ -233,7 +446,7 @@ class Table(Item):
 
         if path is not None:
             with open(path, 'w', encoding = 'utf-8') as file:
-                json.dump(data, file, indent = indent, ensure_ascii = False)
+                dump(data, file, indent = indent)
 
         return data
 
@@ -243,7 +456,10 @@ class Table(Item):
 
     @property
     def n_chars(self):
-        return len(json.dumps(self.json, ensure_ascii = False))
+        if self._n_chars is None:
+            self._n_chars = get_total_n_chars(self.json, self.label)
+
+        return self._n_chars
 
     @property
     def stats(self):
@@ -254,6 +470,9 @@ class Table(Item):
 
     @property
     def content(self):
+        if self._grid is not None:
+            return self._grid.content
+
         return [
             [
                 cell.text
@@ -262,13 +481,21 @@ class Table(Item):
             for row in self.rows
         ]
 
+    # Sibling paragraphs are iterators over w:p tags starting from the nearest one, which are taken from the document index when it is available
+
     @property
     def next_sibling_paragraphs(self):
-        return self.soup.findNextSiblings('w:p')
+        if self.index is not None and (offset := self.index.get_table_offset(self.soup)) is not None:
+            return (paragraph.soup for paragraph in self.index.next_paragraphs(offset))
+
+        return (sibling for sibling in self.soup.next_siblings if sibling.name == 'w:p')
 
     @property
     def previous_sibling_paragraphs(self):
-        return self.soup.findPreviousSiblings('w:p')
+        if self.index is not None and (offset := self.index.get_table_offset(self.soup)) is not None:
+            return (paragraph.soup for paragraph in self.index.previous_paragraphs(offset))
+
+        return (sibling for sibling in self.soup.previous_siblings if sibling.name == 'w:p')
 
     @property
     def next_sibling_paragraph(self):
@@ -314,6 +541,9 @@ class Table(Item):
 
     @property
     def as_texts(self):
+        if self._grid is not None:
+            return self._grid.as_texts
+
         return [
             cell.text
             for row in self.rows
@@ -322,6 +552,9 @@ class Table(Item):
 
 
 class TableStats:
+    counts: ClassVar[tuple[str]] = ('n_cells', 'n_rows', 'n_cols', 'n_numeric_cells', 'n_text_cells', 'n_empty_cells')
+    distributions: ClassVar[tuple[str]] = ('n_chars', 'n_chars_numeric', 'n_chars_text', 'n_rowspans', 'n_colspans')
+
     def __init__(self, table: Table):
         self._item = table
 
@@ -340,7 +573,7 @@ class TableStats:
         n_rowspans = []
         n_colspans = []
 
-        for row in table.data['rows']:
+        for row in table.rows:
             n_rows += 1
 
             n_cols_current_row = 0
@@ -349,7 +582,7 @@ class TableStats:
             for cell in row:
                 n_cols_current_row += 1
 
-                if (cell_text := cell.get('text')) is not None:
+                if (cell_text := cell.text) is not None:
                     n_cols_current_row_without_placeholders += 1
                     n_chars.append(cell_length := len(cell_text))
 
@@ -362,8 +595,8 @@ class TableStats:
                         n_text_cells += 1
                         n_chars_text.append(cell_length)
 
-                    n_rowspans.append(cell.get('rows'))
-                    n_colspans.append(cell.get('cols'))
+                    n_rowspans.append(cell.n_rows)
+                    n_colspans.append(cell.n_cols)
 
             n_cells += n_cols_current_row_without_placeholders
 
@@ -387,6 +620,31 @@ class TableStats:
         self.n_rowspans = n_rowspans
         self.n_colspans = n_colspans
 
+    @classmethod
+    def from_json(cls, json: dict):
+        stats = cls.__new__(cls)
+        stats._item = None
+
+        for name in cls.counts:
+            setattr(stats, name, json[name])
+
+        for name in cls.distributions:
+            setattr(stats, name, [value for value, count in json[name] for _ in range(count)])
+
+        return stats
+
+    def to_json(self):  # distributions are stored as sorted (value, count) pairs, since the order of cells does not affect any statistic
+        data = {name: getattr(self, name) for name in self.counts}
+
+        for name in self.distributions:
+            data[name] = sorted(Counter(getattr(self, name)).items())
+
+        return data
+
+    @property
+    def is_non_trivial(self):
+        return self.n_cells > 1 and self.n_rows > 1 and self.n_cols > 1
+
     @property
     def as_vector(self):
         return [
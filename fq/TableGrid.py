@@ -0,0 +1,147 @@
+from numpy import array, int32, int64, cumsum, zeros
+
+from .Cell import Cell, Placeholder
+
+
+class TableGrid:  # table content as parallel arrays - one text buffer for all cells plus spans and ids of origin cells, and a layout of rows
+    __slots__ = ('buffer', 'text_offsets', 'n_rows', 'n_cols', 'ids', 'row_offsets', 'origins', 'placeholders')
+
+    def __init__(self, buffer: str, text_offsets, n_rows, n_cols, ids: list, row_offsets, origins, placeholders):
+        self.buffer = buffer
+        self.text_offsets = text_offsets  # origin cell i has text buffer[text_offsets[i]:text_offsets[i + 1]]
+
+        self.n_rows = n_rows
+        self.n_cols = n_cols
+        self.ids = ids
+
+        self.row_offsets = row_offsets  # slots of row j are origins[row_offsets[j]:row_offsets[j + 1]]
+        self.origins = origins  # index of the origin cell for every slot
+        self.placeholders = placeholders  # whether the slot is a placeholder
+
+    @classmethod
+    def _from_arrays(cls, texts: list[str], n_rows: list[int], n_cols: list[int], ids: list, row_offsets: list[int], origins: list[int], placeholders: list[bool]):
+        text_offsets = zeros(len(texts) + 1, dtype = int64)
+
+        if len(texts) > 0:
+            text_offsets[1:] = cumsum([len(text) for text in texts])
+
+        return cls(
+            ''.join(texts), text_offsets, array(n_rows, dtype = int32), array(n_cols, dtype = int32), ids,
+            array(row_offsets, dtype = int64), array(origins, dtype = int32), array(placeholders, dtype = bool)
+        )
+
+    @classmethod
+    def from_rows(cls, rows: list[list[Cell]]):
+        texts, n_rows, n_cols, ids = [], [], [], []
+        row_offsets, origins, placeholders = [0], [], []
+
+        origin_to_index = {}
+
+        for row in rows:
+            for cell in row:
+                origin = cell.origin if (is_placeholder := isinstance(cell, Placeholder)) else cell
+
+                if (index := origin_to_index.get(id(origin))) is None:
+                    origin_to_index[id(origin)] = index = len(texts)
+
+                    texts.append('' if origin.text is None else origin.text)
+                    n_rows.append(origin.n_rows)
+                    n_cols.append(origin.n_cols)
+                    ids.append(origin.id)
+
+                origins.append(index)
+                placeholders.append(is_placeholder)
+
+            row_offsets.append(len(origins))
+
+        return cls._from_arrays(texts, n_rows, n_cols, ids, row_offsets, origins, placeholders)
+
+    @classmethod
+    def from_json(cls, rows: list[list[dict]]):  # same layout as Cell.deserialize_rows expects, but without creating cell objects
+        texts, n_rows, n_cols, ids = [], [], [], []
+        row_offsets, origins, placeholders = [0], [], []
+
+        id_to_index = {}
+
+        for row in rows:
+            for cell in row:
+                cell_id = cell['id']
+
+                if (text := cell.get('text')) is None:
+                    origins.append(id_to_index[cell_id])
+                    placeholders.append(True)
+                else:
+                    id_to_index[cell_id] = index = len(texts)
+
+                    texts.append(text)
+                    n_rows.append(cell.get('rows'))
+                    n_cols.append(cell.get('cols'))
+                    ids.append(cell_id)
+
+                    origins.append(index)
+                    placeholders.append(False)
+
+            row_offsets.append(len(origins))
+
+        return cls._from_arrays(texts, n_rows, n_cols, ids, row_offsets, origins, placeholders)
+
+    @property
+    def texts(self):  # text of every origin cell
+        buffer = self.buffer
+        text_offsets = self.text_offsets.tolist()
+
+        return [buffer[start:end] for start, end in zip(text_offsets[:-1], text_offsets[1:])]
+
+    def _iterate_rows(self):
+        row_offsets = self.row_offsets.tolist()
+        origins = self.origins.tolist()
+        placeholders = self.placeholders.tolist()
+
+        for start, end in zip(row_offsets[:-1], row_offsets[1:]):
+            yield zip(origins[start:end], placeholders[start:end])
+
+    def to_rows(self):
+        cells = [
+            Cell(text, n_rows = n_rows, n_cols = n_cols, id_ = id_)
+            for text, n_rows, n_cols, id_ in zip(self.texts, self.n_rows.tolist(), self.n_cols.tolist(), self.ids)
+        ]
+
+        return [
+            [
+                cells[origin].make_placeholder() if is_placeholder else cells[origin]
+                for origin, is_placeholder in row
+            ]
+            for row in self._iterate_rows()
+        ]
+
+    @property
+    def content(self):
+        texts = self.texts
+
+        return [
+            [
+                None if is_placeholder else texts[origin]
+                for origin, is_placeholder in row
+            ]
+            for row in self._iterate_rows()
+        ]
+
+    @property
+    def as_texts(self):
+        return [text for row in self.content for text in row]
+
+    def serialize_rows(self):  # same as Cell.serialize_rows(self.to_rows())
+        texts = self.texts
+        n_rows = self.n_rows.tolist()
+        n_cols = self.n_cols.tolist()
+        ids = self.ids
+
+        return {
+            'rows': [
+                [
+                    {'id': ids[origin]} if is_placeholder else {'id': ids[origin], 'text': texts[origin], 'rows': n_rows[origin], 'cols': n_cols[origin]}
+                    for origin, is_placeholder in row
+                ]
+                for row in self._iterate_rows()
+            ]
+        }
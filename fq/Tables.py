@@ -1,131 +1,230 @@
 from __future__ import annotations
 
-import os
-import json
+from typing import Iterable, Callable
+from math import nan
+from collections import deque
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 
 from numpy import percentile
 from pandas import DataFrame
 
 from .Table import Table, TableStats
+from .ShardStore import list_tables, read_table
+from .BinaryStore import BinaryStore
+from .ColumnarStats import ColumnarStats
+from .QuantileSketch import QuantileSketch, DEFAULT_RELATIVE_ERROR
+
+
+DEFAULT_PREFETCH = 256
+DEFAULT_CHUNK_SIZE = 64  # tables loaded by a worker process in one task
+
+
+def load_table(path: str, label: str, location: str | tuple[str, int, int], grid: bool = False):
+    return Table.from_json(read_table(path, location), label = label, root = path, grid = grid)
+
+
+def read_xml(path: str, location: str | tuple[str, int, int]):
+    return read_table(path, location).get('xml')
+
+
+def load_chunk(path: str, locations: list[tuple], grid: bool = False):
+    # Tables are sent back to the parent process without inline xml, which is usually the bulk of the table and is rarely needed,
+    # it is read from disk again when requested
+
+    tables = []
+
+    for label, location in locations:
+        table = load_table(path, label, location, grid)
+
+        if isinstance(table._xml, str):
+            table._xml = partial(read_xml, path, location)
+
+        tables.append(table)
+
+    return tables
+
+
+def iterate_tables(path: str, grid: bool = False, workers: int = 1, prefetch: int = DEFAULT_PREFETCH):
+    if grid and (store := BinaryStore.from_dir(path)) is not None:  # grids are views over the memory-mapped store, so no pool is needed
+        return store.tables()
+
+    return load_tables(path, list_tables(path), grid, workers, prefetch)
+
+
+def load_tables(
+    path: str, locations: Iterable[tuple], grid: bool = False, workers: int = 1, prefetch: int = DEFAULT_PREFETCH, chunk_size: int = DEFAULT_CHUNK_SIZE
+):
+    # Tables are loaded in the background by a pool of processes in chunks of consecutive locations, at most prefetch tables ahead of the consumer,
+    # and are yielded in the order of locations
+
+    if workers < 2:
+        for label, location in locations:
+            yield load_table(path, label, location, grid)
+
+        return
+
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = deque()
+        locations = iter(locations)
+
+        while len(chunk := list(islice(locations, chunk_size))) > 0:
+            futures.append(executor.submit(load_chunk, path, chunk, grid))
+
+            if len(futures) * chunk_size >= prefetch:
+                yield from futures.popleft().result()
+
+        while futures:
+            yield from futures.popleft().result()
+
+
+def is_non_trivial(table: Table):
+    return table.stats.is_non_trivial
+
+
+def get_sum(values: list | QuantileSketch):
+    return values.sum if isinstance(values, QuantileSketch) else sum(values)
+
+
+def get_percentiles(values: list | QuantileSketch, percents: tuple[float]):
+    if len(values) < 1:
+        return [nan for _ in percents]
+
+    return values.percentile(percents) if isinstance(values, QuantileSketch) else percentile(values, percents)
 
 
 class Tables:
-    def __init__(self, items: list[Table], base: Tables = None):
+    def __init__(self, items: Iterable[Table] | Callable[[], Iterable[Table]], base: Tables = None, predicate: Callable[[Table], bool] = None):
+        # Items are either a list or a function which loads the tables anew on every pass, so that the collection is never held in memory as a whole.
+        # Any other iterable can be passed only once. A collection with a base keeps the base items which satisfy the predicate
+
         self._base = base
         self._items = items
+        self._predicate = predicate
         self._stats = None
 
     @classmethod
-    def from_dir(cls, path: str):
-        tables = []
-
-        for filename in os.listdir(path):
-            with open(os.path.join(path, filename), 'r') as file:
-                tables.append(
-                    Table.from_json(
-                        json.load(file),
-                        filename
-                    )
-                )
+    def from_dir(cls, path: str, grid: bool = False, workers: int = 1, prefetch: int = DEFAULT_PREFETCH):
+        # with grid = True the rows of each table are kept in compact arrays and materialized only when accessed
 
-        return cls(tables)
+        return cls(partial(iterate_tables, path, grid, workers, prefetch))
 
     @property
     def stats(self):
         if self._stats is None:
-            self._stats = TablesStats(self._items, None if self._base is None else self._base.stats)
+            if self._base is None:
+                self._stats = TablesStats(self)
+            elif self._base._stats is not None:
+                self._stats = TablesStats(self, self._base._stats)
+            else:  # stats of the base and of the subset are collected in one pass over the base
+                self._stats = TablesStats.from_stream(self._base, self._predicate, streaming = False)
+                self._stats.tables = self
+
+                self._base._stats = self._stats._base_stats
+                self._base._stats.tables = self._base
 
         return self._stats
 
     @property
     def non_trivial(self):
         return Tables(
-            [item for item in self._items if item.stats.n_cells > 1 and item.stats.n_rows > 1 and item.stats.n_cols > 1],
-            base = self if self._base is None else self._base
+            self._items,
+            base = self if self._base is None else self._base,
+            predicate = is_non_trivial if (predicate := self._predicate) is None else lambda item: predicate(item) and is_non_trivial(item)
         )
 
     @property
     def labels(self):
-        return [item.label for item in self._items]
+        return [item.label for item in self]
 
     def __iter__(self):
-        return self._items
+        items = self._items() if callable(self._items) else self._items
+
+        return iter(items) if self._predicate is None else (item for item in items if self._predicate(item))
 
 
 class TablesStats:
-    def __init__(self, tables: Tables, base_stats: TablesStats = None):
+    def __init__(
+        self, tables: Iterable[Table] = (), base_stats: TablesStats = None, streaming: bool = False, relative_error: float = DEFAULT_RELATIVE_ERROR
+    ):
+        # in streaming mode the distributions are folded into quantile sketches, and neither the tables nor the per-cell values are kept in memory
+
         self._base_stats = base_stats
 
-        self.tables = tables
+        self.tables = None if streaming else tables
 
-        n_tables = 0
+        def make_collection():
+            return QuantileSketch(relative_error) if streaming else []
 
-        n_cells = []
-        n_rows = []
-        n_cols = []
-        n_chars = []
+        self.n_tables = 0
+        self.total_length = 0
 
-        total_length = 0
+        self.n_rows = make_collection()
+        self.n_cols = make_collection()
+        self.n_cells = make_collection()
+        self.n_chars = make_collection()
 
-        n_numeric_cells = []
-        n_text_cells = []
-        n_empty_cells = []
+        self.n_numeric_cells = make_collection()
+        self.n_text_cells = make_collection()
+        self.n_empty_cells = make_collection()
 
-        n_chars_numeric = []
-        n_chars_text = []
+        self.n_chars_numeric = make_collection()
+        self.n_chars_text = make_collection()
 
-        n_rowspans = []
-        n_colspans = []
+        self.n_rowspans = make_collection()
+        self.n_colspans = make_collection()
 
-        mean_rowspans = []
-        mean_colspans = []
+        self.mean_rowspans = make_collection()
+        self.mean_colspans = make_collection()
 
         for table in tables:
-            n_tables += 1
+            self.add(table)
 
-            total_length += table.n_chars
+    @classmethod
+    def from_stream(
+        cls, tables: Iterable[Table], predicate: Callable[[Table], bool] = None, relative_error: float = DEFAULT_RELATIVE_ERROR, streaming: bool = True
+    ):
+        # stats of the tables which satisfy the predicate, with stats of all tables as the base, computed in one pass over the stream
 
-            stats = table.stats
+        base_stats = None if predicate is None else cls(streaming = streaming, relative_error = relative_error)
+        stats = cls(base_stats = base_stats, streaming = streaming, relative_error = relative_error)
 
-            n_rows.append(stats.n_rows)
-            n_cols.append(stats.n_cols)
-            n_cells.append(stats.n_cells)
+        for table in tables:
+            if base_stats is not None:
+                base_stats.add(table)
 
-            n_chars.extend(stats.n_chars)
+            if predicate is None or predicate(table):
+                stats.add(table)
 
-            n_numeric_cells.append(stats.n_numeric_cells)
-            n_text_cells.append(stats.n_text_cells)
-            n_empty_cells.append(stats.n_empty_cells)
+        return stats
 
-            n_chars_numeric.extend(stats.n_chars_numeric)
-            n_chars_text.extend(stats.n_chars_text)
+    def add(self, table: Table):
+        self.add_stats(table.stats, table.n_chars)
 
-            n_rowspans.extend(stats.n_rowspans)
-            n_colspans.extend(stats.n_colspans)
+    def add_stats(self, stats: TableStats, n_chars: int):
+        self.n_tables += 1
 
-            mean_rowspans.append(stats.mean_rowspan)
-            mean_colspans.append(stats.mean_colspan)
+        self.total_length += n_chars
 
-        self.n_tables = n_tables
-        self.total_length = total_length
+        self.n_rows.append(stats.n_rows)
+        self.n_cols.append(stats.n_cols)
+        self.n_cells.append(stats.n_cells)
 
-        self.n_rows = n_rows
-        self.n_cols = n_cols
-        self.n_cells = n_cells
-        self.n_chars = n_chars
+        self.n_chars.extend(stats.n_chars)
 
-        self.n_numeric_cells = n_numeric_cells
-        self.n_text_cells = n_text_cells
-        self.n_empty_cells = n_empty_cells
+        self.n_numeric_cells.append(stats.n_numeric_cells)
+        self.n_text_cells.append(stats.n_text_cells)
+        self.n_empty_cells.append(stats.n_empty_cells)
 
-        self.n_chars_numeric = n_chars_numeric
-        self.n_chars_text = n_chars_text
+        self.n_chars_numeric.extend(stats.n_chars_numeric)
+        self.n_chars_text.extend(stats.n_chars_text)
 
-        self.n_rowspans = n_rowspans
-        self.n_colspans = n_colspans
+        self.n_rowspans.extend(stats.n_rowspans)
+        self.n_colspans.extend(stats.n_colspans)
 
-        self.mean_rowspans = mean_rowspans
-        self.mean_colspans = mean_colspans
+        self.mean_rowspans.append(stats.mean_rowspan)
+        self.mean_colspans.append(stats.mean_colspan)
 
     @property
     def total_length_as_str(self):
@@ -133,32 +232,36 @@ class TablesStats:
 
     @property
     def n_cells_sum(self):
-        return sum(self.n_cells)
+        return get_sum(self.n_cells)
 
     @property
     def n_numeric_cells_sum(self):
-        return sum(self.n_numeric_cells)
+        return get_sum(self.n_numeric_cells)
 
     @property
     def n_text_cells_sum(self):
-        return sum(self.n_text_cells)
+        return get_sum(self.n_text_cells)
 
     @property
     def n_empty_cells_sum(self):
-        return sum(self.n_empty_cells)
+        return get_sum(self.n_empty_cells)
 
     @property
     def as_df(self):
-        df = DataFrame(
-            [table.stats.as_vector for table in self.tables],
-            columns = TableStats.vector_legend
-        )
+        if self.tables is None:
+            raise ValueError('Tables are not kept in streaming mode')
+
+        return ColumnarStats.from_tables(self.tables).normalize()
+
+    @staticmethod
+    def normalize(vectors: list[list[float]]):  # z-scores of TableStats.as_vector features
+        df = DataFrame(vectors, columns = TableStats.vector_legend)
 
         return (df - df.mean()) / df.std()
 
     def print(self):
         # def print_percentiles(label: str, data: list):
-        #     percentiles = ' '.join(map(''.join, zip(('5%: ', '25%: ', '50%: ', '75%: ', '95%: '), map(lambda value: f'{value:.1f}', percentile(data, (5, 25, 50, 75, 95))))))
+        #     percentiles = ' '.join(map(''.join, zip(('5%: ', '25%: ', '50%: ', '75%: ', '95%: '), map(lambda value: f'{value:.1f}', get_percentiles(data, (5, 25, 50, 75, 95))))))
         #     print(f'{label}: {percentiles}')
 
         def add_percentiles(label: str, data: list, accumulator: dict = None):
@@ -168,7 +271,7 @@ class TablesStats:
             accumulator[label] = {
                 key: value
                 for key, value in
-                zip(('5%', '25%', '50%', '75%', '95%'), map(lambda value: f'{value:.1f}', percentile(data, (5, 25, 50, 75, 95))))
+                zip(('5%', '25%', '50%', '75%', '95%'), map(lambda value: f'{value:.1f}', get_percentiles(data, (5, 25, 50, 75, 95))))
             }
 
             return accumulator
@@ -0,0 +1,49 @@
+import os
+
+
+XML_STORE_DIRNAME = '.xml'
+
+
+class XmlStore:  # sidecar file which keeps raw xml of all tables parsed from one document, so that table files contain only metadata and rows
+    def __init__(self, root: str, name: str):
+        self.root = root
+        self.path = os.path.join(XML_STORE_DIRNAME, name)
+
+        self._file = None
+        self.offset = 0
+
+    def write(self, xml: str):
+        if self._file is None:
+            os.makedirs(os.path.join(self.root, XML_STORE_DIRNAME), exist_ok = True)
+            self._file = open(os.path.join(self.root, self.path), 'wb')
+
+        data = xml.encode('utf-8')
+        self._file.write(data)
+
+        ref = {
+            'path': self.path,
+            'offset': self.offset,
+            'length': len(data)
+        }
+
+        self.offset += len(data)
+
+        return ref
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def read(root: str, ref: dict):
+        with open(os.path.join(root, ref['path']), 'rb') as file:
+            file.seek(ref['offset'])
+
+            return file.read(ref['length']).decode('utf-8')
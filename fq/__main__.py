@@ -1,10 +1,10 @@
 import os
-import json
 import shutil
+from itertools import islice
 # from time import sleep
 
 import matplotlib.pyplot as plt
-from click import argument, group, option
+from click import argument, group, option, Choice
 from numpy import percentile, random as np_random, mean, std
 # from tqdm import tqdm
 from pathlib import Path
@@ -16,10 +16,22 @@ from pandas import read_csv
 # from camelot import read_pdf
 
 from .util import unpack, is_number  # , normalize_spaces
+from .util.serialization import dump, dumps, load
 # from .Cell import Cell
-from .Tables import Tables
+from .Tables import Tables, TablesStats, DEFAULT_PREFETCH, iterate_tables, is_non_trivial
+from .QuantileSketch import DEFAULT_RELATIVE_ERROR
+from .ColumnarStats import ColumnarStats
+from .StatsCache import StatsCache
+from .MetadataIndex import MetadataIndex
+from .SearchIndex import SearchIndex, DEFAULT_LIMIT
+from .BinaryStore import BinaryStore, BINARY_STORE_FILENAME
+from .XmlStore import XML_STORE_DIRNAME
+from .Deduplicator import Deduplicator, DEFAULT_THRESHOLD, DEFAULT_N_PERMUTATIONS, DEFAULT_SHINGLE_SIZE, DUPLICATES_FILENAME, read_duplicates
+from .TableType import TableType
 # from .TableTranslator import TableTranslator
 from .Parser import Parser
+from .Table import Table
+from .ShardStore import ShardStore, read_tables, is_sharded
 
 
 @group()
@@ -44,13 +56,18 @@ QUESTION_GENERATION_PROMPT = '{task}\n\nTABLE: {table}'
 
 @main.command()
 @argument('path', type = str)
-def make_questions(path: str):
-    with open(path, 'r') as file:
-        table = json.load(file)
+@option('--skip-duplicates', '-d', is_flag = True)
+def make_questions(path: str, skip_duplicates: bool):
+    if skip_duplicates and (canonical := read_duplicates(os.path.dirname(path)).get(os.path.basename(path))) is not None:
+        print(f'{path} is a near duplicate of {canonical}, skipping')
+        return
+
+    with open(path, 'rb') as file:
+        table = load(file)
 
     prompt = QUESTION_GENERATION_PROMPT.format(
         task = QUESTION_GENERATION_TASK_DESCRIPTION,
-        table = json.dumps(table['rows'], ensure_ascii = False, indent = 2)
+        table = dumps(table['rows'], indent = 2)
     )
 
     # print(prompt)
@@ -127,9 +144,26 @@ def make_questions(path: str):
 @argument('path', type = str)
 @option('--n-clusters', '-n', type = int, default = 2)
 @option('--seed', '-s', type = int, default = 17)
-def clusterize(path: str, n_clusters: int, seed: int):
+def clusterize(path: str, n_clusters: int, seed: int):  # path is either a .tsv file written by stats --save or a directory with tables
     pca = PCA(n_components = 2)
-    df = read_csv(path, sep = '\t')
+    path = os.path.normpath(path)  # otherwise a trailing slash would put the clusters inside the directory
+
+    if os.path.isdir(path):
+        stats_cache = StatsCache.from_dir(path)
+        stats_cache.update()
+        stats_cache.save()
+
+        labels, df = stats_cache.get_features()
+        jsons_path = path
+    else:
+        df = read_csv(path, sep = '\t')
+        jsons_path = path.split('.')[0]
+
+        labels = []
+
+        with open(jsons_path + '.txt', 'r') as file:
+            for line in file.readlines():
+                labels.append(line[:-1])
 
     df_compressed = pca.fit_transform(df)
     df_compressed_jitter = df_compressed + np_random.normal(loc = 0, scale = 0.01, size = df_compressed.shape)
@@ -140,15 +174,7 @@ def clusterize(path: str, n_clusters: int, seed: int):
     # print(cluster_labels)
 
     n_files_per_cluster = [0 for _ in range(n_clusters)]
-    jsons_path = path.split('.')[0]
     clusters_path = jsons_path + '_clusters'
-    labels_path = jsons_path + '.txt'
-
-    labels = []
-
-    with open(labels_path, 'r') as file:
-        for line in file.readlines():
-            labels.append(line[:-1])
 
     if os.path.isdir(clusters_path):
         shutil.rmtree(clusters_path)
@@ -156,9 +182,16 @@ def clusterize(path: str, n_clusters: int, seed: int):
     for i in range(0, n_clusters):
         os.makedirs(os.path.join(clusters_path, f'{i:02d}'))
 
+    store = ShardStore(jsons_path) if is_sharded(jsons_path) else None
+
     for file, cluster in zip(labels, cluster_labels):
         n_files_per_cluster[cluster] += 1
-        shutil.copy(os.path.join(jsons_path, file), os.path.join(clusters_path, f'{cluster:02d}', file))
+
+        if store is None:
+            shutil.copy(os.path.join(jsons_path, file), os.path.join(clusters_path, f'{cluster:02d}', file))
+        else:
+            with open(os.path.join(clusters_path, f'{cluster:02d}', file), 'w', encoding = 'utf-8') as cluster_file:
+                dump(store.read(file), cluster_file, indent = 2)
 
     for cluster, count in sorted([(i, count) for i, count in enumerate(n_files_per_cluster)], key = lambda item: item[1], reverse = True):
         print(f'{cluster:02d}: {count:03d}')
@@ -179,15 +212,138 @@ def clusterize(path: str, n_clusters: int, seed: int):
 @main.command()
 @argument('path', type = str)
 @option('--save', '-s', is_flag = True)
-def stats(path: str, save: bool):
-    if save:
-        (tables := Tables.from_dir(path).non_trivial).stats.as_df.to_csv(f'{path}.tsv', index = False, sep = '\t')
-
+@option('--workers', '-w', type = int, default = 1)
+@option('--prefetch', '-p', type = int, default = DEFAULT_PREFETCH)
+@option('--streaming', is_flag = True)
+@option('--relative-error', '-e', type = float, default = DEFAULT_RELATIVE_ERROR)
+@option('--cache/--no-cache', default = True)
+def stats(path: str, save: bool, workers: int, prefetch: int, streaming: bool, relative_error: float, cache: bool):
+    def write_labels(labels: list[str]):
         with open(f'{path}.txt', 'w') as file:
-            for label in tables.labels:
+            for label in labels:
                 file.write(f'{label}\n')
+
+    if cache:  # only new and modified tables are loaded
+        stats_cache = StatsCache.from_dir(path)
+        stats_cache.update(workers, prefetch)
+        stats_cache.save()
+
+        if save:
+            labels, df = stats_cache.get_features()
+
+            df.to_csv(f'{path}.tsv', index = False, sep = '\t')
+            write_labels(labels)
+        else:
+            stats_cache.get_stats(streaming, relative_error).print()
+    elif save:
+        columns = ColumnarStats.from_tables(iterate_tables(path, grid = True, workers = workers, prefetch = prefetch))
+        columns.normalize(non_trivial := columns.non_trivial).to_csv(f'{path}.tsv', index = False, sep = '\t')
+
+        write_labels([label for label, is_kept in zip(columns.labels, non_trivial.tolist()) if is_kept])
+    elif streaming:
+        TablesStats.from_stream(iterate_tables(path, grid = True, workers = workers, prefetch = prefetch), is_non_trivial, relative_error).print()
+    elif MetadataIndex.exists(path):  # trivial tables are filtered out by the index without loading them
+        with MetadataIndex(path) as index:
+            index.update(workers, prefetch)
+            index.load(grid = True, workers = workers, prefetch = prefetch).non_trivial.stats.print()
     else:
-        Tables.from_dir(path).non_trivial.stats.print()
+        Tables.from_dir(path, grid = True, workers = workers, prefetch = prefetch).non_trivial.stats.print()
+
+
+@main.command()
+@argument('path', type = str)
+@option('--type', '-t', 'type_', type = Choice([type_.value for type_ in TableType]))
+@option('--source', '-s', type = str)
+@option('--id', 'id_', type = str)
+@option('--title', '-q', type = str)
+@option('--min-rows', type = int)
+@option('--max-rows', type = int)
+@option('--min-cols', type = int)
+@option('--max-cols', type = int)
+@option('--min-cells', type = int)
+@option('--max-cells', type = int)
+@option('--non-trivial', '-n', is_flag = True)
+@option('--where', type = str, help = 'SQL condition over the columns of the index, inserted into the query as is; it can only read the index')
+@option('--update/--no-update', default = True)
+@option('--workers', '-w', type = int, default = 1)
+def query(path: str, type_: str, source: str, id_: str, title: str, non_trivial: bool, where: str, update: bool, workers: int, **ranges: int):
+    with MetadataIndex(path) as index:
+        if update:
+            index.update(workers)
+
+        for label, _ in index.select(type_, source, id_, title, non_trivial, where, **ranges):
+            print(label)
+
+
+@main.command()
+@argument('path', type = str)
+@argument('query', type = str)
+@option('--phrase', '-p', is_flag = True)
+@option('--limit', '-n', type = int, default = DEFAULT_LIMIT)
+@option('--update/--no-update', default = True)
+@option('--workers', '-w', type = int, default = 1)
+def search(path: str, query: str, phrase: bool, limit: int, update: bool, workers: int):
+    with SearchIndex(path) as index:
+        if update:
+            index.update(workers)
+
+        for label, score, fields in index.search(query, phrase, limit):
+            print(f'{score:.3f}\t{label}')
+
+            for kind, *location, n_matches in fields:
+                if kind == 'cell':
+                    row, col, n_rows, n_cols = location
+                    print(f'\tcell row {row} col {col} ({n_rows}x{n_cols}): {n_matches}')
+                else:
+                    print(f'\t{kind}{"" if len(location) < 1 else f" {location[0]}"}: {n_matches}')
+
+
+@main.command()
+@argument('path', type = str)
+@option('--threshold', '-t', type = float, default = DEFAULT_THRESHOLD)
+@option('--permutations', '-p', type = int, default = DEFAULT_N_PERMUTATIONS)
+@option('--shingle-size', '-k', type = int, default = DEFAULT_SHINGLE_SIZE)
+@option('--workers', '-w', type = int, default = 1)
+@option('--verbose', '-v', is_flag = True)
+def dedup(path: str, threshold: float, permutations: int, shingle_size: int, workers: int, verbose: bool):
+    # finds near duplicate tables and saves the map from each of them to its canonical table, which translate and make_questions use to skip them
+
+    deduplicator = Deduplicator.from_dir(path, workers, threshold = threshold, n_permutations = permutations, shingle_size = shingle_size)
+    deduplicator.save(path)
+
+    if verbose:
+        for canonical, labels in sorted(deduplicator.clusters.items()):
+            print(canonical)
+
+            for label in labels:
+                print(f'\t{label}')
+
+    print(
+        f'Found {len(deduplicator.duplicates)} near duplicates of {len(deduplicator.clusters)} tables among {deduplicator.n_tables} tables, '
+        f'the map is saved to {os.path.join(path, DUPLICATES_FILENAME)}'
+    )
+
+
+@main.command(name = 'to-binary')
+@argument('path', type = str)
+def to_binary(path: str):  # packs tables of the directory into a memory-mapped store, which is kept next to them
+    store = BinaryStore.build(path)
+
+    print(f'Packed {len(store.index)} tables into {os.path.join(path, BINARY_STORE_FILENAME)}')
+
+
+@main.command(name = 'from-binary')
+@argument('path', type = str)
+@argument('destination', type = str)
+@option('--indent', '-i', type = int, default = 2)
+def from_binary(path: str, destination: str, indent: int):  # unpacks the store into one json file per table
+    store = BinaryStore(path)
+    store.to_dir(destination, indent)
+
+    if os.path.isdir(xml_path := os.path.join(path, XML_STORE_DIRNAME)) and not os.path.samefile(path, destination):
+        shutil.copytree(xml_path, os.path.join(destination, XML_STORE_DIRNAME), dirs_exist_ok = True)
+
+    print(f'Unpacked {len(store.index)} tables into {destination}')
 
 
 @main.command(name = 'unpack')
@@ -204,7 +360,8 @@ def unpack_(source: str, destination: str):
 @argument('source', type = str)
 @argument('destination', type = str)
 @option('--first-n', '-n', type = int, required = False)
-def translate(source: str, destination: str, first_n: int):
+@option('--skip-duplicates', '-d', is_flag = True)
+def translate(source: str, destination: str, first_n: int, skip_duplicates: bool):
     from .TableTranslator import TableTranslator
 
     print('Collecting texts...')
@@ -212,32 +369,26 @@ def translate(source: str, destination: str, first_n: int):
     if not os.path.isdir(destination):
         os.makedirs(destination)
 
+    duplicates = read_duplicates(source) if skip_duplicates else {}
+
     texts = []
     tables = []
 
-    source_files = os.listdir(source)
-
-    if first_n is not None:
-        source_files = source_files[:first_n]
-
-    for source_file in source_files:
-        with open(os.path.join(source, source_file), 'r') as file:
-            table = json.load(file)
-
-            for row in table['rows']:
-                for cell in row:
-                    if (text := cell.get('text')) is not None and len(text) > 0 and not is_number(text):
-                        texts.append(text)
-                        cell['_requires-translation'] = True
-                    else:
-                        cell['_requires-translation'] = False
+    for source_file, table in islice(((source_file, table) for source_file, table in read_tables(source) if source_file not in duplicates), first_n):
+        for row in table['rows']:
+            for cell in row:
+                if (text := cell.get('text')) is not None and len(text) > 0 and not is_number(text):
+                    texts.append(text)
+                    cell['_requires-translation'] = True
+                else:
+                    cell['_requires-translation'] = False
 
-            table['_filename'] = source_file
+        table['_filename'] = source_file
 
-            if (context := table.get('context')) is not None:
-                texts.append(context)
+        if (context := table.get('context')) is not None:
+            texts.append(context)
 
-            tables.append(table)
+        tables.append(table)
 
     # print(len(texts))
     # print(tables[0])
@@ -268,7 +419,7 @@ def translate(source: str, destination: str, first_n: int):
             offset += 1
 
         with open(os.path.join(destination, filename), 'w') as file:
-            json.dump(table, file, indent = 2, ensure_ascii = False)
+            dump(table, file, indent = 2)
 
 
 @main.command()
@@ -286,8 +437,23 @@ def view(source: str):
 @main.command()
 @argument('source', type = str)
 @argument('destination', type = str)
-def parse(source: str, destination: str):
-    Parser().parse(source, destination)
+@option('--streaming', '-s', is_flag = True)
+@option('--workers', '-w', type = int, default = 1)
+@option('--force', '-f', is_flag = True)
+@option('--xml-sidecar', '-x', is_flag = True)
+@option('--sharded', is_flag = True)
+@option('--shard-size', type = int, default = 64)  # megabytes
+@option('--zstd', '-z', is_flag = True)
+@option('--compact-ids', '-c', is_flag = True)
+@option('--search-index', '-i', is_flag = True)
+def parse(
+    source: str, destination: str, streaming: bool, workers: int, force: bool, xml_sidecar: bool, sharded: bool, shard_size: int, zstd: bool, compact_ids: bool,
+    search_index: bool
+):
+    Parser(
+        streaming = streaming, xml_sidecar = xml_sidecar, sharded = sharded, max_shard_size = shard_size * 1024 * 1024, compress = zstd,
+        compact_ids = compact_ids, search_index = search_index
+    ).parse(source, destination, workers = workers, force = force)
 
     # for source_file in tqdm(os.listdir(source)):
     #     document = Document(os.path.join(source, source_file))
@@ -357,6 +523,21 @@ def parse(source: str, destination: str):
     #             json.dump(Cell.serialize_rows(parsed_rows, context), file, indent = 2, ensure_ascii = False)
 
 
+@main.command(name = 'parse-normacs')
+@argument('source', type = str)
+@argument('destination', type = str)
+def parse_normacs(source: str, destination: str):
+    if not os.path.isdir(destination):
+        os.makedirs(destination)
+
+    stem = Path(source).stem
+
+    with open(source, 'rb') as file:
+        for i, table in enumerate(Table.from_normacs_stream(file)):
+            table.label = os.path.join(destination, f'{stem}.{i:04d}'.replace(' ', '_')) + '.json'
+            table.to_json(table.label)
+
+
 @main.command()
 @argument('path', type = str)
 @option('--pages', '-p', type = str, default = 'all')
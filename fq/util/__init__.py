@@ -1,4 +1,6 @@
-from .zip import unpack
-from .string import normalize_spaces, unescape_translation, has_not_fewer_dots_than, drop_space_around_punctuation, is_not_empty, is_space
-from .number import is_number
-from .xml import is_bold, is_h1
+from .zip import unpack, is_archive, list_members, read_member, close_archives
+from .string import normalize_spaces, unescape_translation, has_not_fewer_dots_than, drop_space_around_punctuation, is_not_empty, is_space, normalize_text, normalize_texts, tokenize
+from .number import is_number, are_numbers
+from .xml import is_bold, is_h1, iterparse_tables
+from .automaton import Automaton
+from .varint import encode_varints, decode_varints, encode_positions, decode_positions
@@ -0,0 +1,64 @@
+from collections import deque
+
+
+class Automaton:  # Aho-Corasick automaton which finds occurrences of all keys in a text in a single pass
+    def __init__(self, keys: list[str]):
+        transitions = [{}]
+        outputs = [[]]
+
+        for key in set(keys):
+            if len(key) < 1:
+                continue
+
+            node = 0
+
+            for char in key:
+                if (next_node := transitions[node].get(char)) is None:
+                    transitions[node][char] = next_node = len(transitions)
+                    transitions.append({})
+                    outputs.append([])
+
+                node = next_node
+
+            outputs[node].append(key)
+
+        fallbacks = [0 for _ in transitions]
+        queue = deque(transitions[0].values())
+
+        while queue:
+            node = queue.popleft()
+
+            for char, next_node in transitions[node].items():
+                fallback = fallbacks[node]
+
+                while fallback > 0 and char not in transitions[fallback]:
+                    fallback = fallbacks[fallback]
+
+                fallbacks[next_node] = transitions[fallback].get(char, 0)
+                outputs[next_node] = outputs[next_node] + outputs[fallbacks[next_node]]
+
+                queue.append(next_node)
+
+        self.transitions = transitions
+        self.fallbacks = fallbacks
+        self.outputs = outputs
+
+    def find_first(self, text: str):  # key -> position of its first occurrence, as str.find would return
+        transitions = self.transitions
+        fallbacks = self.fallbacks
+        outputs = self.outputs
+
+        positions = {}
+        node = 0
+
+        for i, char in enumerate(text):
+            while node > 0 and char not in transitions[node]:
+                node = fallbacks[node]
+
+            node = transitions[node].get(char, 0)
+
+            for key in outputs[node]:
+                if key not in positions:
+                    positions[key] = i - len(key) + 1
+
+        return positions
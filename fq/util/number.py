@@ -1,7 +1,30 @@
 import re
 
+from numpy import frombuffer, uint32, zeros, unique, cumsum, diff, ndarray, int64
+
 NUMBER_TEMPLATE = re.compile(r'(?:[^\w]|[0-9])+')
+NOT_NUMBER_CHAR_TEMPLATE = re.compile(r'[^\W0-9]')  # word characters other than digits, which is_number does not accept
+MAX_CODEPOINT = 0x110000
 
 
 def is_number(string: str):
     return NUMBER_TEMPLATE.fullmatch(string)
+
+
+_is_classified = zeros(MAX_CODEPOINT, dtype = bool)
+_is_not_number_char = zeros(MAX_CODEPOINT, dtype = bool)
+
+
+def are_numbers(buffer: str, offsets: ndarray):
+    # Same as is_number for every text buffer[offsets[i]:offsets[i + 1]], but with characters classified once per distinct codepoint
+
+    codepoints = frombuffer(buffer.encode('utf-32-le', 'surrogatepass'), dtype = uint32)
+
+    if len(new_codepoints := unique(codepoints[~_is_classified[codepoints]])) > 0:
+        _is_not_number_char[new_codepoints] = [NOT_NUMBER_CHAR_TEMPLATE.fullmatch(chr(codepoint)) is not None for codepoint in new_codepoints.tolist()]
+        _is_classified[new_codepoints] = True
+
+    n_not_number_chars = zeros(len(codepoints) + 1, dtype = int64)
+    n_not_number_chars[1:] = cumsum(_is_not_number_char[codepoints])
+
+    return (diff(offsets) > 0) & (diff(n_not_number_chars[offsets]) == 0)
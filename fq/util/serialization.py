@@ -0,0 +1,76 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# All backends produce json which is semantically equal to json.dumps(data, indent = indent, ensure_ascii = False), but not always the same text -
+# e.g. orjson writes 1e16 where json writes 1e+16. Compact output differs in separators as well
+
+class StdlibBackend:
+    name = 'json'
+
+    @staticmethod
+    def dumps(data, indent: int = None, compact: bool = False):
+        return json.dumps(data, indent = indent, ensure_ascii = False, separators = (',', ':') if compact and indent is None else None)
+
+    @staticmethod
+    def loads(data: str | bytes):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(data, indent: int = None, compact: bool = False):
+        try:
+            if indent == 2:
+                return orjson.dumps(data, option = orjson.OPT_INDENT_2).decode('utf-8')
+
+            if indent is None and compact:
+                return orjson.dumps(data).decode('utf-8')
+        except TypeError:  # numpy scalars, ints wider than 64 bits, non-str keys and other values which only json accepts
+            pass
+
+        return StdlibBackend.dumps(data, indent, compact)  # orjson supports neither other indents nor default separators
+
+    @staticmethod
+    def loads(data: str | bytes):
+        return orjson.loads(data)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (StdlibBackend, OrjsonBackend)
+    if backend is StdlibBackend or orjson is not None
+}
+
+backend = OrjsonBackend if orjson is not None else StdlibBackend
+
+
+def set_backend(name: str):
+    global backend
+
+    if (backend_ := BACKENDS.get(name)) is None:
+        raise ValueError(f'Json backend {name} is not available, choose one of: {", ".join(BACKENDS)}')
+
+    backend = backend_
+
+
+def dumps(data, indent: int = None, compact: bool = False):
+    return backend.dumps(data, indent, compact)
+
+
+def loads(data: str | bytes):
+    return backend.loads(data)
+
+
+def dump(data, file, indent: int = None, compact: bool = False):
+    file.write(backend.dumps(data, indent, compact))
+
+
+def load(file):
+    return backend.loads(file.read())
@@ -8,6 +8,14 @@ PUNCTUATION_WITH_TRAILING_SPACE = re.compile(r'([\[])\s+')
 
 SINGLE_SPACE = re.compile(r'\s')
 
+# Equivalent of drop_space_around_punctuation(normalize_spaces(string)): spaces which would be dropped around punctuation are removed
+# in the first pass, and the rest are collapsed in the second one
+
+SPACE_AROUND_PUNCTUATION = re.compile(r'(?<=[\[])\s+|\s+(?=[.,;])')
+BATCH_SEP = '\x00'  # neither a space nor punctuation, so lookarounds never cross the boundary between texts
+
+TOKEN = re.compile(r'\w+(?:[./-]\w+)*')  # words, numbers and identifiers such as 12.3.004-75 or APPLICATION_ID are kept whole
+
 
 def normalize_spaces(string: str):
     return SPACE.sub(' ', string).strip()
@@ -38,9 +46,32 @@ def drop_space_around_punctuation(string: str):
     )
 
 
+def normalize_text(string: str):
+    return SPACE.sub(' ', SPACE_AROUND_PUNCTUATION.sub('', string)).strip()
+
+
+def normalize_texts(strings: list[str]):
+    if len(strings) < 1:
+        return []
+
+    joined = BATCH_SEP.join('' if string is None else string for string in strings)
+
+    if joined.count(BATCH_SEP) != len(strings) - 1:  # some of the texts contain the separator
+        return [None if string is None else normalize_text(string) for string in strings]
+
+    return [
+        None if string is None else normalized.strip()
+        for string, normalized in zip(strings, SPACE.sub(' ', SPACE_AROUND_PUNCTUATION.sub('', joined)).split(BATCH_SEP))
+    ]
+
+
 def is_not_empty(text: str):
     return text is not None and len(text.strip()) > 0
 
 
 def is_space(text: str):
     return SINGLE_SPACE.fullmatch(text) is not None
+
+
+def tokenize(text: str):
+    return TOKEN.findall(text.lower())
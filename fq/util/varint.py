@@ -0,0 +1,46 @@
+def encode_varints(values: list[int]):  # non-negative integers, 7 bits per byte with the high bit set on all bytes but the last one
+    data = bytearray()
+
+    for value in values:
+        while value > 0x7f:
+            data.append(value & 0x7f | 0x80)
+            value >>= 7
+
+        data.append(value)
+
+    return bytes(data)
+
+
+def decode_varints(data: bytes):
+    values = []
+
+    value = 0
+    shift = 0
+
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+
+            value = 0
+            shift = 0
+
+    return values
+
+
+def encode_positions(positions: list[int]):  # sorted positions as gaps between them
+    return encode_varints([position - previous for previous, position in zip([0, *positions], positions)])
+
+
+def decode_positions(data: bytes):
+    positions = []
+    position = 0
+
+    for gap in decode_varints(data):
+        position += gap
+        positions.append(position)
+
+    return positions
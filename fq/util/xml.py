@@ -1,4 +1,15 @@
+from typing import BinaryIO
+from zipfile import ZipFile
+
 from docx.text.paragraph import Paragraph
+from lxml import etree
+from bs4 import BeautifulSoup
+
+
+DOCUMENT_PART = 'word/document.xml'
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = f'{W_NAMESPACE}body'
+W_TBL = f'{W_NAMESPACE}tbl'
 
 
 def is_bold(paragraph: Paragraph):
@@ -17,3 +28,35 @@ def is_h1(paragraph: Paragraph):
     style = paragraph.soup.find('w:pstyle')
 
     return style is not None and style.get('w:val') == '1'
+
+
+def to_soup(element: etree._Element):
+    etree.indent(element)  # python-docx pretty-prints the document xml, and cell texts depend on the whitespace between runs
+
+    tag = BeautifulSoup(etree.tostring(element, encoding = 'unicode', with_tail = False), 'lxml').find('w:tbl')
+
+    for attribute in [attribute for attribute in tag.attrs if attribute.startswith('xmlns')]:
+        del tag[attribute]
+
+    return tag
+
+
+# Yields the same tags as BeautifulSoup(document._element.xml, 'lxml').find_all('w:tbl'), but reads the document incrementally
+# and drops every body-level block as soon as it is processed, so only one table is kept in memory at a time
+
+def iterparse_tables(source: str | BinaryIO):
+    with ZipFile(source, 'r') as archive, archive.open(DOCUMENT_PART) as file:
+        for _, element in etree.iterparse(file, events = ('end', ), huge_tree = True):
+            if element.tag == W_TBL and next(element.iterancestors(W_TBL), None) is None:
+                table = to_soup(element)
+
+                yield table
+
+                for nested_table in table.find_all('w:tbl'):
+                    yield nested_table
+
+            if (parent := element.getparent()) is not None and parent.tag == W_BODY:
+                element.clear(keep_tail = True)
+
+                while element.getprevious() is not None:
+                    del parent[0]
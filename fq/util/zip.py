@@ -12,19 +12,73 @@ def truncate_name(name, suffix, max_length=100):
     return ' '.join(components[:2]) + suffix
 
 
+def decode_name(info: zipfile.ZipInfo):
+    return info.filename.encode('cp437').decode('utf-8')
+
+
+def get_unpacked_names(infos: list[zipfile.ZipInfo]):
+    # name which every file member gets after unpacking -> the member, names which collide after truncation are told apart by a counter
+
+    names = {}
+
+    for info in infos:
+        if info.is_dir():
+            continue
+
+        path = Path(decode_name(info))
+        name = truncate_name(path.stem, path.suffix)
+
+        i = 1
+
+        while name in names:
+            i += 1
+            name = truncate_name(path.stem, f' ({i}){path.suffix}')
+
+        names[name] = info
+
+    return names
+
+
+def is_archive(path: str):
+    return os.path.isfile(path) and Path(path).suffix.lower() == '.zip'
+
+
+def list_members(source: str):  # name which the member would get after unpacking -> name of the member in the archive
+    with zipfile.ZipFile(source, 'r') as archive:  # not the cached archive, so that forked workers do not inherit an open file
+        return {name: info.filename for name, info in get_unpacked_names(archive.infolist()).items()}
+
+
+_archives = {}  # (process id, path) -> open archive
+
+
+def open_archive(source: str):
+    # The archive is kept open to avoid reading the central directory for every member. Each process opens its own file,
+    # since a file inherited by forked workers would share the read offset with the parent and the other workers
+
+    if (archive := _archives.get(key := (os.getpid(), source))) is None:
+        _archives[key] = archive = zipfile.ZipFile(source, 'r')
+
+    return archive
+
+
+def close_archives():
+    for archive in _archives.values():
+        archive.close()
+
+    _archives.clear()
+
+
+def read_member(source: str, member: str):
+    return open_archive(source).read(member)
+
+
 def unpack(source: str, destination: str):
     if not os.path.isdir(destination):
         os.makedirs(destination)
 
     with zipfile.ZipFile(source, 'r') as zip_ref:
-        for info in zip_ref.infolist():
-            if info.is_dir():
-                continue
-
-            original_name = info.filename.encode('cp437').decode('utf-8')
-
-            path = Path(original_name)
-            truncated_name = truncate_name(path.stem, path.suffix)
+        for truncated_name, info in get_unpacked_names(zip_ref.infolist()).items():
+            original_name = decode_name(info)
 
             # truncated_name = truncate_name(original_name)
 
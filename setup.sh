@@ -33,7 +33,7 @@ conda activate tables
 conda install python-lsp-server -y
 conda install tqdm numpy matplotlib click -y
 
-pip install python-docx beautifulsoup4 requests scikit-learn pandas
+pip install python-docx beautifulsoup4 lxml requests scikit-learn pandas zstandard orjson ijson
 
 # To install ghostscript see: https://ghostscript.readthedocs.io/en/gs10.03.0/Install.html and https://ghostscript.com/docs/9.55.0/Install.htm. Basically:
 #
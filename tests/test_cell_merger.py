@@ -0,0 +1,52 @@
+from random import Random
+
+from pytest import mark
+
+from fq.Cell import Cell, Placeholder
+from fq.CellMerger import merge_horizontally, merge_vertically, merge
+
+
+N_GRIDS = 3000
+TEXTS = (None, '', 'a', 'b', 'c')
+
+
+def make_grid(random: Random):  # small alphabet, so that runs and vertical repeats are frequent
+    return [[Cell(random.choice(TEXTS)) for _ in range(random.randint(0, 7))] for _ in range(random.randint(0, 8))]
+
+
+def copy(rows: list[list[Cell]]):
+    return [[Cell(cell.text, cell.n_rows, cell.n_cols) for cell in row] for row in rows]
+
+
+def describe(rows: list[list[Cell]]):  # structure of the grid with cells numbered in the order of appearance, so that shared objects can be compared
+    numbers = {}
+
+    return [
+        [
+            (
+                isinstance(cell, Placeholder),
+                numbers.setdefault(id(cell), len(numbers)),
+                numbers.setdefault(id(origin := cell.origin if isinstance(cell, Placeholder) else cell), len(numbers)),
+                origin.text, origin.n_rows, origin.n_cols
+            )
+            for cell in row
+        ]
+        for row in rows
+    ]
+
+
+def merge_with_cells(rows: list[list[Cell]]):
+    return Cell.merge_vertically([Cell.merge_horizontally(row) for row in rows])
+
+
+@mark.parametrize('seed', range(3))
+def test_merge_matches_cell_methods(seed: int):
+    random = Random(seed)
+
+    for _ in range(N_GRIDS):
+        rows = make_grid(random)
+        merged_rows = [Cell.merge_horizontally(row) for row in copy(rows)]
+
+        assert describe(merge_horizontally(copy(rows))) == describe(merged_rows)
+        assert describe(merge_vertically(copy(merged_rows))) == describe(Cell.merge_vertically(copy(merged_rows)))
+        assert describe(merge(copy(rows))) == describe(merge_with_cells(copy(rows)))